@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+# Local stand-in for an ADS WebSocket server - for offline testing and load generation.
+# Speaks the subset of the tr_json2 protocol used by pywstestclient.py:
+#  Login Refresh with PingTimeout, Batch requests, Refresh / Update / Status, Ping / Pong and Close
+# Requires the websockets package
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+import codec
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+opts = None
+
+# Parse command line arguments
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='local ADS WebSocket simulator',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-H', dest='host',
+                        help='interface to listen on',
+                        default='localhost')
+    parser.add_argument('-p', dest='port',
+                        help='port to listen on',
+                        type=int,
+                        default=15000)
+    parser.add_argument('-ur', dest='updateRate',
+                        help='Updates per second per connection - spread across the open items',
+                        type=float,
+                        default=1000)
+    parser.add_argument('-n', dest='maxItems',
+                        help='Max open items per connection - further requests are rejected (0=no limit)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-rf', dest='refreshFields',
+                        help='Number of Fields in each Refresh',
+                        type=int,
+                        default=20)
+    parser.add_argument('-uf', dest='updateFields',
+                        help='Number of Fields in each Update',
+                        type=int,
+                        default=5)
+    parser.add_argument('-bd', dest='bookDepth',
+                        help='Map entries (orders / price levels) in each MarketByOrder / MarketByPrice Refresh',
+                        type=int,
+                        default=50)
+    parser.add_argument('-bpe', dest='bookPartEntries',
+                        help='Max Map entries per Refresh part - larger books are sent as a multi part Refresh',
+                        type=int,
+                        default=100)
+    parser.add_argument('-ba', dest='bookActions',
+                        help='Max Map entries (Add / Update / Delete) in each order book Update',
+                        type=int,
+                        default=3)
+    parser.add_argument('-rr', dest='rejectRatio',
+                        help='Fraction of item requests rejected with a Closed Status',
+                        type=float,
+                        default=0.0)
+    parser.add_argument('-pt', dest='pingTimeout',
+                        help='PingTimeout sent in Login Refresh - Pings are sent every third of it',
+                        type=int,
+                        default=30)
+    parser.add_argument('-mpf', dest='msgsPerFrame',
+                        help='Max messages packed into each JSON array frame',
+                        type=int,
+                        default=20)
+    parser.add_argument('-z', dest='compress',
+                        help='Accept permessage-deflate compression if the client asks for it',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-s', dest='seed',
+                        help='Random seed - for repeatable runs',
+                        type=int,
+                        default=None)
+
+    return (parser.parse_args(args))
+
+# Field names + values for the Refresh / Update payloads
+def make_fields(count, ric=None):
+    fields = {}
+    if ric is not None:
+        fields['DSPLY_NAME'] = ric
+    for i in range(count - len(fields)):
+        fields['FIELD_{}'.format(i)] = round(random.uniform(1, 1000), 4)
+    return fields
+
+BOOK_DOMAINS = ('MarketByOrder', 7, 'MarketByPrice', 8)
+BY_ORDER_DOMAINS = ('MarketByOrder', 7)
+
+# Order book of a MarketByOrder / MarketByPrice item - Map Key -> (side, price)
+# MarketByOrder entries are keyed by order id, MarketByPrice by price + side
+class Book:
+
+    def __init__(self, by_order):
+        self.by_order = by_order
+        self.entries = {}
+        self.next_order = 1
+
+    def new_entry(self):
+        side = random.choice(('BID', 'ASK'))
+        price = round(random.uniform(99, 100) if side == 'BID' else random.uniform(100, 101), 2)
+        if self.by_order:
+            key = '{:016X}'.format(self.next_order)
+            self.next_order += 1
+            fields = {'ORDER_PRC': price, 'ORDER_SIDE': side, 'ORDER_SIZE': random.randint(1, 100) * 100}
+        else:
+            key = '{}{}'.format(price, side[0])
+            fields = {'ORDER_PRC': price, 'ORDER_SIDE': side, 'ACC_SIZE': random.randint(1, 100) * 100,
+                      'NO_ORD': random.randint(1, 20)}
+        self.entries[key] = (side, price)
+        return {'Action': 'Add', 'Key': key, 'Fields': fields}
+
+    # Add while the book is short, otherwise any of Add / Update / Delete
+    def random_action(self):
+        if len(self.entries) < opts.bookDepth // 2:
+            return self.new_entry()
+        action = random.choice(('Add', 'Update', 'Update', 'Delete'))
+        if action == 'Add':
+            return self.new_entry()
+        key = random.choice(list(self.entries))
+        if action == 'Delete':
+            del self.entries[key]
+            return {'Action': 'Delete', 'Key': key}
+        return {'Action': 'Update', 'Key': key,
+                'Fields': {'ORDER_SIZE' if self.by_order else 'ACC_SIZE': random.randint(1, 100) * 100}}
+
+# Refresh parts for an order book - Map entries split across parts, all but the last not Complete
+def book_refresh(stream_id, ric, domain, state):
+    book = Book(domain in BY_ORDER_DOMAINS)
+    entries = [book.new_entry() for _ in range(opts.bookDepth)]
+    size = opts.bookPartEntries if opts.bookPartEntries>0 else len(entries) or 1
+    parts = []
+    for i in range(0, max(len(entries), 1), size):
+        part = {'ID': stream_id, 'Type': 'Refresh', 'Domain': domain, 'Key': {'Name': ric},
+                'Map': {'KeyType': 'Buffer', 'Entries': entries[i:i + size]}, 'State': state}
+        if i == 0:
+            part['Map']['Summary'] = {'Fields': make_fields(4, ric)}
+        if i + size < len(entries):
+            part['Complete'] = False
+        parts.append(part)
+    return book, parts
+
+# State of one client connection
+class ClientConnection:
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.logged_in = False
+        self.items = {}         # StreamID -> (RIC, Domain) of the open streaming items
+        self.books = {}         # StreamID -> Book of the open order book items
+        self.stream_list = []   # StreamIDs in the order we cycle through for Updates
+        self.next_update = 0    # Position in stream_list of next item to Update
+
+    async def send(self, messages):
+        for i in range(0, len(messages), opts.msgsPerFrame):
+            await self.ws.send(codec.dumps(messages[i:i + opts.msgsPerFrame]))
+
+    def open_count(self):
+        return len(self.items)
+
+    # Login request - or a reissue of the auth token which gets no Refresh
+    async def process_login(self, message):
+        if message.get('Refresh', True) is False:
+            return
+        self.logged_in = True
+        name = message.get('Key', {}).get('Name', 'user')
+        await self.send([{
+            'ID': message['ID'], 'Type': 'Refresh', 'Domain': 'Login',
+            'Key': {'Name': name, 'Elements': message.get('Key', {}).get('Elements', {})},
+            'Elements': {'PingTimeout': opts.pingTimeout, 'MaxMsgSize': 61430},
+            'State': {'Stream': 'Open', 'Data': 'Ok', 'Text': 'Login accepted by simulator'}}])
+
+    # Single or Batch item request - Batch items get StreamIDs from request ID + 1 onwards
+    async def process_request(self, message):
+        names = message['Key']['Name']
+        domain = message.get('Domain', 'MarketPrice')
+        if isinstance(names, list):
+            ids = range(message['ID'] + 1, message['ID'] + 1 + len(names))
+        else:
+            names, ids = [names], [message['ID']]
+        streaming = message.get('Streaming', True)
+        view = message.get('View')
+
+        responses = []
+        for stream_id, ric in zip(ids, names):
+            if random.random() < opts.rejectRatio:
+                text = 'The record could not be found'
+            elif opts.maxItems and self.open_count() >= opts.maxItems:
+                text = 'Item limit reached'
+            else:
+                text = None
+            if text:
+                responses.append({'ID': stream_id, 'Type': 'Status', 'Key': {'Name': ric},
+                                  'State': {'Stream': 'Closed', 'Data': 'Suspect', 'Code': 'NotFound', 'Text': text}})
+                continue
+            state = {'Stream': 'Open' if streaming else 'NonStreaming', 'Data': 'Ok'}
+            if domain in BOOK_DOMAINS:
+                book, parts = book_refresh(stream_id, ric, domain, state)
+                responses.extend(parts)
+                if streaming:
+                    self.books[stream_id] = book
+            else:
+                fields = make_fields(opts.refreshFields, ric)
+                if view:
+                    fields = {k: v for k, v in fields.items() if k in view} or fields
+                refresh = {'ID': stream_id, 'Type': 'Refresh', 'Key': {'Name': ric}, 'Fields': fields,
+                           'State': state}
+                if domain not in ('MarketPrice', 6):
+                    refresh['Domain'] = domain
+                responses.append(refresh)
+            if streaming and stream_id not in self.items:
+                self.items[stream_id] = (ric, domain)
+                self.stream_list.append(stream_id)
+        await self.send(responses)
+
+    def process_close(self, message):
+        ids = message['ID'] if isinstance(message['ID'], list) else [message['ID']]
+        for stream_id in ids:
+            if self.items.pop(stream_id, None) is not None:
+                self.stream_list.remove(stream_id)
+                self.books.pop(stream_id, None)
+
+    async def process_message(self, message):
+        message_type = message.get('Type', 'Request')
+        if message.get('Domain') == 'Login':
+            if message_type == 'Close':
+                await self.ws.close()
+            else:
+                await self.process_login(message)
+        elif message_type == 'Request':
+            await self.process_request(message)
+        elif message_type == 'Close':
+            self.process_close(message)
+        elif message_type == 'Ping':
+            await self.send([{'Type': 'Pong'}])
+
+    # Send Pings at a third of the PingTimeout
+    async def pinger(self):
+        while True:
+            await asyncio.sleep(opts.pingTimeout / 3.0)
+            if self.logged_in:
+                await self.send([{'Type': 'Ping'}])
+
+    # Send Updates at the configured rate - cycling through the open items
+    async def updater(self):
+        tick = 0.01
+        due = 0.0
+        last = time.time()
+        while True:
+            await asyncio.sleep(tick)
+            now = time.time()
+            due += (now - last) * opts.updateRate
+            last = now
+            count = int(due)
+            if count == 0 or not self.stream_list:
+                if not self.stream_list:
+                    due = 0.0
+                continue
+            due -= count
+            updates = []
+            for _ in range(count):
+                self.next_update = (self.next_update + 1) % len(self.stream_list)
+                stream_id = self.stream_list[self.next_update]
+                book = self.books.get(stream_id)
+                if book is not None:
+                    entries = [book.random_action() for _ in range(random.randint(1, max(1, opts.bookActions)))]
+                    update = {'ID': stream_id, 'Type': 'Update', 'UpdateType': 'Unspecified',
+                              'Map': {'KeyType': 'Buffer', 'Entries': entries}}
+                else:
+                    update = {'ID': stream_id, 'Type': 'Update', 'UpdateType': 'Quote',
+                              'Fields': make_fields(opts.updateFields)}
+                domain = self.items[stream_id][1]
+                if domain not in ('MarketPrice', 6):
+                    update['Domain'] = domain
+                updates.append(update)
+            await self.send(updates)
+
+async def handle_client(ws):
+    client = ClientConnection(ws)
+    print("Client connected")
+    tasks = [asyncio.ensure_future(client.pinger()), asyncio.ensure_future(client.updater())]
+    try:
+        async for frame in ws:
+            messages = codec.loads(frame)
+            if isinstance(messages, dict):
+                messages = [messages]
+            for message in messages:
+                await client.process_message(message)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        print("Client disconnected - {} items were open".format(client.open_count()))
+
+async def serve():
+    async with websockets.serve(handle_client, opts.host, opts.port,
+                                subprotocols=['tr_json2'], max_size=None,
+                                ping_interval=None, compression='deflate' if opts.compress else None):
+        print("ADS simulator listening on ws://{}:{}/WebSocket".format(opts.host, opts.port))
+        await asyncio.Future()
+
+if __name__ == '__main__':
+    opts = parse_args(sys.argv[1:])
+    if websockets is None:
+        print('The ADS simulator requires the websockets package')
+        sys.exit(2)
+    if opts.seed is not None:
+        random.seed(opts.seed)
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
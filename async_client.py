@@ -0,0 +1,160 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" asyncio engine - a single event loop drives one or more WebSocket sessions """
+
+import ssl
+import time
+import asyncio
+import market_data
+import wire
+
+try:
+    import websockets
+except ImportError:     # Only required for the asyncio engine
+    websockets = None
+
+try:
+    from websockets.asyncio.client import ClientConnection
+    from websockets.protocol import State
+except ImportError:     # websockets before 13.0 - wire bytes are worked out from the frame sizes instead
+    ClientConnection = None
+
+compression = None      # 'deflate' to negotiate permessage-deflate - set by -z
+
+# Counts the bytes actually read from and written to the connection - i.e. after any compression
+# The HTTP upgrade request and response are not WebSocket bytes, so are left out
+if ClientConnection is not None:
+    class CountingConnection(ClientConnection):
+
+        def connection_made(self, transport):
+            super().connection_made(transport)
+            self.handshake_read = 0
+            write = transport.write
+
+            def counted_write(data):
+                if self.protocol.state is not State.CONNECTING:
+                    wire.wire_sent(len(data))
+                write(data)
+            transport.write = counted_write
+
+        def data_received(self, data):
+            if self.protocol.state is not State.CONNECTING:
+                wire.wire_received(len(data))
+                super().data_received(data)
+                return
+            # Upgrade response - the read completing it may also hold the first frames
+            self.handshake_read += len(data)
+            super().data_received(data)
+            if self.protocol.state is not State.CONNECTING and self.response is not None:
+                wire.wire_received(max(0, self.handshake_read - len(self.response.serialize())))
+
+# One WebSocket connection + Login driven by the event loop
+# Passed to market_data in place of the websocket-client WebSocketApp,
+# so login / request / ping handling is shared with the threaded engine
+class AsyncSession:
+
+    def __init__(self, ws_address, source, sslctx=None):
+        self.ws_address = ws_address
+        self.source = source    # RicSource of the RICs to request on this session
+        self.sslctx = sslctx
+        self.conn = None
+        self.send_queue = None
+        self.ping_deadline = 0
+
+    # market_data calls send() from within the event loop - queue it for the writer task
+    def send(self, data):
+        self.send_queue.put_nowait(data)
+
+    async def _writer(self):
+        while True:
+            data = await self.send_queue.get()
+            await self.conn.send(data)
+
+    # Time left before we should have heard from the server again
+    def _ping_wait(self):
+        return max(0, self.ping_deadline - time.time())
+
+    # Connect, Login and process messages until closed, ping timeout or cancelled
+    # If reconnect is enabled, keep reconnecting with backoff until shutdown
+    async def run(self):
+        market_data.set_session_rics(self, self.source)
+        try:
+            while True:
+                await self._run_connection()
+                conn = market_data.connections.get(self)
+                if market_data.shutdown_app or (conn is None) or (not conn.reconnect_time):
+                    break
+                await asyncio.sleep(max(0, conn.reconnect_time - time.time()))
+                conn.reconnect_time = 0
+        finally:
+            market_data.connections.pop(self, None)
+
+    async def _run_connection(self):
+        print("Connecting to WebSocket " + self.ws_address + " ...")
+        self.send_queue = asyncio.Queue()
+        options = {}
+        if wire.exact_wire:
+            options['create_connection'] = CountingConnection
+        try:
+            self.conn = await websockets.connect(self.ws_address,
+                                                 subprotocols=['tr_json2'],
+                                                 user_agent_header='Python',
+                                                 ssl=self.sslctx,
+                                                 ping_interval=None,    # Server sends JSON Pings
+                                                 max_size=None,
+                                                 compression=compression,
+                                                 **options)
+        except (OSError, websockets.exceptions.WebSocketException) as error:
+            market_data.on_error(self, error)
+            market_data.on_close(self)
+            return
+        if compression:
+            self._report_compression()
+
+        writer = asyncio.ensure_future(self._writer())
+        try:
+            market_data.on_open(self)
+            self.ping_deadline = time.time() + market_data.ping_timeout_interval
+            while True:
+                try:
+                    message = await asyncio.wait_for(self.conn.recv(), self._ping_wait())
+                except asyncio.TimeoutError:
+                    print("No ping from server, timing out")
+                    self.conn.transport.abort()     # No close handshake with an unresponsive server
+                    market_data.on_close(self)
+                    break
+                market_data.on_message(self, message)
+                self.ping_deadline = time.time() + market_data.ping_timeout_interval
+        except websockets.exceptions.ConnectionClosed:
+            market_data.on_close(self)
+        finally:
+            writer.cancel()
+
+    # Server may decline the extension - so report what was actually negotiated
+    def _report_compression(self):
+        protocol = getattr(self.conn, 'protocol', self.conn)     # websockets 13.0+ / legacy
+        names = [extension.name for extension in getattr(protocol, 'extensions', [])]
+        wire.compression = ', '.join(names) or None
+        print("Compression: {}".format(wire.compression or 'not accepted by the server'))
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+# Build the SSL context for 'wss' connections - hostname is not checked, as per the threaded engine
+def make_ssl_context():
+    sslctx = ssl.create_default_context()
+    sslctx.check_hostname = False
+    return sslctx
+
+# Call fn every interval seconds - until cancelled
+async def every(interval, fn):
+    while True:
+        await asyncio.sleep(interval)
+        fn()
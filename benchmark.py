@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+# End to end benchmark of pywstestclient.py against the local ADS simulator.
+# Each scenario runs the client as a separate process and records messages/sec,
+# CPU seconds per 1k messages, peak RSS and the time for all items to respond.
+# Results are written to a JSON file which can be compared with a previous run.
+# Unix only - uses os.wait4 to get the resource usage of each client process
+
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import signal
+import socket
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Client arguments, simulator arguments and how long to stream for (None = snapshot run with -e)
+SCENARIOS = {
+    'snapshot_2k':      {'client': ['-f', '2krics.txt', '-e'], 'sim': ['-ur', '0']},
+    'snapshot_3k':      {'client': ['-f', '3krics.txt', '-e'], 'sim': ['-ur', '0']},
+    'snapshot_100k':    {'client': ['-f', '{rics_100k}', '-e', '-bs', '5000', '-mo', '20000'], 'sim': ['-ur', '0']},
+    'stream_1k_per_sec':  {'client': ['-f', '3krics.txt'], 'sim': ['-ur', '1000'], 'stream': True},
+    'stream_10k_per_sec': {'client': ['-f', '3krics.txt'], 'sim': ['-ur', '10000'], 'stream': True},
+    'stream_50k_per_sec': {'client': ['-f', '3krics.txt'], 'sim': ['-ur', '50000'], 'stream': True},
+    'multi_domain':     {'client': ['-ef', 'extrics.txt', '-e'], 'sim': ['-ur', '0']},
+    'multi_domain_stream': {'client': ['-ef', 'mixedrics.txt'], 'sim': ['-ur', '5000'], 'stream': True},
+}
+
+STATS_PATTERN = re.compile(r'Stats; Refresh: (\d+) \tUpdates: (\d+) \tStatus: (\d+) \tPings: (\d+) \tElapsed Time: ([\d.]+)secs')
+RESPONDED_PATTERN = re.compile(r'All (\d+) items responded in ([\d.]+)secs')
+
+# Parse command line arguments
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='pywstestclient end to end benchmark',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-s', dest='scenarios',
+                        help='comma-separated list of scenarios to run - ' + ', '.join(SCENARIOS),
+                        default=','.join(SCENARIOS))
+    parser.add_argument('-o', dest='outFile',
+                        help='File to write the JSON results to',
+                        default='benchmark_results.json')
+    parser.add_argument('-c', dest='compareFile',
+                        help='Previous JSON results file to compare with',
+                        default=None)
+    parser.add_argument('-ca', dest='clientArgs',
+                        help='Extra arguments for the client e.g. "-async -bs 1000"',
+                        default='')
+    parser.add_argument('-d', dest='duration',
+                        help='How long to run the streaming scenarios for in seconds',
+                        type=int,
+                        default=20)
+    parser.add_argument('-t', dest='timeout',
+                        help='Max time for a scenario in seconds',
+                        type=int,
+                        default=300)
+
+    return (parser.parse_args(args))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=10):
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        try:
+            with socket.create_connection(('localhost', port), 0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def write_rics_100k(dirname):
+    filename = os.path.join(dirname, 'rics_100k.txt')
+    with open(filename, 'w') as f:
+        f.write(''.join('BENCH{}.L\n'.format(i) for i in range(100000)))
+    return filename
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Run the client until it exits (or for the streaming duration) and collect its output + resource usage
+def run_client(args, stream_secs, timeout):
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'pywstestclient.py')] + args,
+                            cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    lines = []
+    reader = threading.Thread(target=lambda: lines.extend(proc.stdout))
+    reader.start()
+
+    stopper = threading.Timer(stream_secs if stream_secs else timeout,
+                              lambda: os.kill(proc.pid, signal.SIGINT))
+    stopper.start()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = status
+    stopper.cancel()
+    reader.join()
+    return lines, rusage
+
+def run_scenario(name, scenario, opts, rics_100k):
+    port = free_port()
+    sim = subprocess.Popen([sys.executable, os.path.join(HERE, 'ads_simulator.py'),
+                            '-p', str(port), '-s', '1'] + scenario['sim'],
+                           cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port):
+            print("Simulator did not start for", name)
+            return None
+        args = ['-H', 'localhost', '-p', str(port), '-st', '5']
+        args += [a.format(rics_100k=rics_100k) for a in scenario['client']]
+        args += shlex.split(opts.clientArgs)
+        started = time.time()
+        lines, rusage = run_client(args, opts.duration if scenario.get('stream') else None, opts.timeout)
+        wall = time.time() - started
+    finally:
+        sim.terminate()
+        sim.wait()
+
+    stats = [STATS_PATTERN.search(line) for line in lines]
+    stats = [m for m in stats if m]
+    if not stats:
+        print("No stats output for", name)
+        print(''.join(lines[-20:]))
+        return None
+    refreshes, updates, status, pings = (int(v) for v in stats[-1].groups()[:4])
+    elapsed = float(stats[-1].group(5))
+    responded = [RESPONDED_PATTERN.search(line) for line in lines]
+    responded = [m for m in responded if m]
+    time_to_all = float(responded[-1].group(2)) if responded else None
+    # Snapshot runs exit once all the items have responded - but the final Stats elapsed time
+    # is rounded up by the client's 1 second poll, so measure them over the time to respond
+    if (not scenario.get('stream')) and time_to_all:
+        elapsed = time_to_all
+    messages = refreshes + updates + status + pings
+    cpu = rusage.ru_utime + rusage.ru_stime
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak_rss_mb = rusage.ru_maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+    return {
+        'messages': messages,
+        'refreshes': refreshes,
+        'updates': updates,
+        'status': status,
+        'elapsed_secs': elapsed,
+        'wall_secs': round(wall, 3),
+        'msgs_per_sec': round(messages / elapsed, 1) if elapsed else None,
+        'cpu_secs': round(cpu, 3),
+        'cpu_secs_per_1k_msgs': round(cpu * 1000.0 / messages, 4) if messages else None,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'time_to_all_refreshes_secs': time_to_all,
+    }
+
+COMPARE_KEYS = ('msgs_per_sec', 'cpu_secs_per_1k_msgs', 'peak_rss_mb', 'time_to_all_refreshes_secs')
+
+def print_results(results, previous=None):
+    print("{:<22} {:>12} {:>12} {:>10} {:>12}".format('Scenario', 'msgs/sec', 'cpu/1k msgs', 'RSS MB', 'all refresh'))
+    for name, result in results.items():
+        print("{:<22} {:>12} {:>12} {:>10} {:>12}".format(
+            name, *(str(result[key]) for key in COMPARE_KEYS)))
+        if previous and name in previous:
+            changes = []
+            for key in COMPARE_KEYS:
+                old, new = previous[name].get(key), result[key]
+                changes.append('{:+.1f}%'.format((new - old) * 100.0 / old) if old and new is not None else '-')
+            print("{:<22} {:>12} {:>12} {:>10} {:>12}".format('  vs previous', *changes))
+
+if __name__ == '__main__':
+    opts = parse_args(sys.argv[1:])
+    names = opts.scenarios.split(',')
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print('Unknown scenarios:', ', '.join(unknown))
+        sys.exit(2)
+
+    previous = None
+    if opts.compareFile:
+        with open(opts.compareFile) as f:
+            previous = json.load(f)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rics_100k = write_rics_100k(tmpdir) if 'snapshot_100k' in names else None
+        for name in names:
+            print("Running", name, "...")
+            result = run_scenario(name, SCENARIOS[name], opts, rics_100k)
+            if result is not None:
+                results[name] = result
+
+    with open(opts.outFile, 'w') as f:
+        json.dump({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'git_commit': git_commit(),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'client_args': opts.clientArgs,
+                   'results': results}, f, indent=2)
+    print('Results written to "{}"'.format(opts.outFile))
+    print_results(results, previous)
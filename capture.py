@@ -0,0 +1,116 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Capture received WebSocket frames to a binary log - and read them back for replay """
+
+import time
+import gzip
+import struct
+import threading
+
+MAGIC = b'WSTCAP1\n'        # File header
+RECORD = struct.Struct('<dI')   # Receive timestamp, payload length - followed by the payload
+GZIP_MAGIC = b'\x1f\x8b'
+
+writer = None   # Active CaptureWriter - set by -rec
+
+class CaptureWriter:
+
+    def __init__(self, filename, compress=False):
+        if compress:
+            self.f = gzip.open(filename, 'wb', compresslevel=1)   # Favour speed over size
+        else:
+            self.f = open(filename, 'wb', buffering=1024 * 1024)
+        self.f.write(MAGIC)
+        self.frames = 0
+        self.lock = threading.Lock()    # Several connections may capture to the same file
+
+    def write(self, frame, received=None):
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        with self.lock:
+            self.f.write(RECORD.pack(received if received is not None else time.time(), len(frame)))
+            self.f.write(frame)
+            self.frames += 1
+
+    def close(self):
+        with self.lock:
+            self.f.close()
+
+def start(filename, compress=False):
+    global writer
+    writer = CaptureWriter(filename, compress)
+    print('Capturing received frames to "{}"'.format(filename))
+
+def record(frame):
+    writer.write(frame)
+
+def stop():
+    global writer
+    if writer is not None:
+        writer.close()
+        print("Captured {} frames".format(writer.frames))
+        writer = None
+
+# Yield (receive time, frame text) for each record in a capture file - compressed or not
+def read_frames(filename):
+    with open(filename, 'rb') as raw:
+        compressed = raw.read(2) == GZIP_MAGIC
+    f = gzip.open(filename, 'rb') if compressed else open(filename, 'rb', buffering=1024 * 1024)
+
+    # A compressed capture that was cut off or never closed ends without the gzip trailer
+    # so gzip raises rather than returning short - read it as the end of the file
+    def read(size):
+        try:
+            return f.read(size)
+        except (EOFError, gzip.BadGzipFile):
+            return b''
+
+    with f:
+        if read(len(MAGIC)) != MAGIC:
+            raise ValueError('"{}" is not a capture file'.format(filename))
+        while True:
+            header = read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            received, length = RECORD.unpack(header)
+            frame = read(length)
+            if len(frame) < length:
+                return      # Truncated final record e.g. capture was killed
+            yield received, frame.decode('utf-8')
+
+# Stands in for the WebSocket during replay - messages the client would have sent are counted and discarded
+class ReplaySocket:
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, data):
+        self.sent += 1
+
+# Feed the frames through the on_message callback
+# speed: 1 = original timing, N = N times faster, 0 = as fast as possible
+# tick: called between frames so the caller can output stats etc.
+def replay(filename, on_message, speed=1.0, tick=None):
+    ws = ReplaySocket()
+    frames = 0
+    started = time.time()
+    first_received = None
+    for received, frame in read_frames(filename):
+        if speed > 0:
+            if first_received is None:
+                first_received = received
+            due = started + (received - first_received) / speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        on_message(ws, frame)
+        frames += 1
+        if tick is not None:
+            tick()
+    return frames, time.time() - started, ws.sent
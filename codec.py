@@ -0,0 +1,48 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" JSON codec - uses orjson when installed, otherwise the standard json module """
+
+import json
+
+try:
+    import orjson
+except ImportError:     # Optional - falls back to the standard json module
+    orjson = None
+
+name = 'orjson' if orjson else 'json'
+
+# Use the standard json module even if orjson is installed
+def use_stdlib():
+    global name, loads, dumps
+    name = 'json'
+    loads = json.loads
+    dumps = _json_dumps
+
+def _json_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj).decode()   # Text frame so send as str
+
+# Decode a received frame (str or bytes) into Python objects
+loads = orjson.loads if orjson else json.loads
+
+# Encode a message to send as compact JSON text
+dumps = _orjson_dumps if orjson else _json_dumps
+
+# Bytes of a frame on the wire - text is sent UTF-8 encoded, so a character may be several bytes
+# ASCII text (the usual case) is not encoded just to be measured
+def encoded_length(frame):
+    if isinstance(frame, str) and not frame.isascii():
+        return len(frame.encode('utf-8'))
+    return len(frame)
+
+# Human readable output - only used when pretty printing has been asked for
+def dumps_pretty(obj):
+    return json.dumps(obj, sort_keys=True, indent=2, separators=(',', ':'))
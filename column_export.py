@@ -0,0 +1,122 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Refresh Fields collected into column buffers - written as CSV or Parquet in one go at exit """
+
+import os
+import csv
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:     # Only used to hand the numeric columns to pyarrow without copying
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:     # Only required for Parquet output
+    pyarrow = None
+
+enabled = False     # Collect the Refresh Fields - set by -xf
+
+NAN = float('nan')
+
+# Values of one Field for every row - numbers in a float array with NaN for missing values,
+# switching to a list if the Field turns out to have non numeric values
+class Column:
+    __slots__ = ('values', 'numeric', 'is_int')
+
+    def __init__(self, rows):
+        self.values = array('d', [NAN]) * rows
+        self.numeric = True
+        self.is_int = True      # All the values so far are whole numbers - written without the '.0'
+
+    def append_missing(self):
+        self.values.append(NAN if self.numeric else None)
+
+    def set(self, row, value):
+        if self.numeric:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.values[row] = value
+                if self.is_int and not isinstance(value, int):
+                    self.is_int = False
+                return
+            self.values = [self.text(i) or None for i in range(len(self.values))]
+            self.numeric = False
+        self.values[row] = value if isinstance(value, str) else str(value)
+
+    def text(self, row):
+        value = self.values[row]
+        if not self.numeric:
+            return '' if value is None else value
+        if math.isnan(value):
+            return ''
+        return str(int(value)) if self.is_int else repr(value)
+
+    def to_arrow(self):
+        if not self.numeric:
+            return pyarrow.array(self.values, pyarrow.string())
+        if numpy is not None:
+            values = numpy.frombuffer(self.values, dtype=numpy.float64)
+            column = pyarrow.array(values, mask=numpy.isnan(values))
+        else:
+            column = pyarrow.array([None if math.isnan(v) else v for v in self.values], pyarrow.float64())
+        return column.cast(pyarrow.int64()) if self.is_int else column
+
+rics = []       # RIC of each row
+domains = []    # Domain of each row
+columns = {}    # Field name -> Column, in the order first seen
+rows = {}       # (websocket, StreamID) -> row - so a multi part Refresh fills in the same row
+
+def refresh(ws, message_json):
+    key = (ws, message_json['ID'])
+    row = rows.get(key)
+    if row is None:
+        row = rows[key] = len(rics)
+        rics.append(message_json.get('Key', {}).get('Name'))
+        domains.append(str(message_json.get('Domain', 'MarketPrice')))
+        for column in columns.values():
+            column.append_missing()
+    for name, value in message_json.get('Fields', {}).items():
+        if value is None:
+            continue
+        column = columns.get(name)
+        if column is None:
+            column = columns[name] = Column(len(rics))
+        column.set(row, value)
+
+def write_csv(filename):
+    names = list(columns)
+    fields = [columns[name] for name in names]
+    with open(filename, 'w', newline='', buffering=1024 * 1024) as f:
+        writer = csv.writer(f)
+        writer.writerow(['RIC', 'Domain'] + names)
+        writer.writerows([rics[row], domains[row]] + [column.text(row) for column in fields]
+                         for row in range(len(rics)))
+
+def write_parquet(filename):
+    table = {'RIC': pyarrow.array(rics, pyarrow.string()), 'Domain': pyarrow.array(domains, pyarrow.string())}
+    for name, column in columns.items():
+        table[name] = column.to_arrow()
+    pyarrow.parquet.write_table(pyarrow.table(table), filename)
+
+def is_parquet(filename):
+    return filename.lower().endswith('.parquet')
+
+# Write all the rows - Parquet if the filename ends .parquet otherwise CSV
+# Written to a temporary file first, so a reader never sees a partial file
+def write(filename):
+    tmp_filename = filename + '.tmp'
+    if is_parquet(filename):
+        write_parquet(tmp_filename)
+    else:
+        write_csv(tmp_filename)
+    os.replace(tmp_filename, filename)
+    print('Exported {} rows x {} Fields to "{}"'.format(len(rics), len(columns), filename))
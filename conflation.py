@@ -0,0 +1,84 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Client side conflation - Updates for an item merged and emitted once per interval """
+
+import time
+import threading
+import codec
+import output
+
+enabled = False     # Conflate the Updates - set by -cf
+interval = 1.0      # Seconds between emitting the conflated Updates
+write = False       # Output the conflated Updates - rather than just count them
+
+raw_count = 0       # Updates received
+emitted_count = 0   # Conflated Updates emitted
+next_emit = 0       # When the conflated Updates are next due
+
+pending = {}        # (websocket, StreamID) -> ConflatedUpdate waiting to be emitted
+lock = threading.Lock()     # Emitted from the message path and, when idle, the main loop
+
+def start(interval_secs, write_updates=False):
+    global enabled, interval, write, next_emit
+    enabled = True
+    interval = interval_secs
+    write = write_updates
+    next_emit = time.time() + interval
+
+# Latest values of the Fields updated since the item was last emitted
+class ConflatedUpdate:
+    __slots__ = ('record', 'updates')
+
+    def __init__(self, message_json):
+        self.record = {'ID': message_json['ID'], 'Type': 'Update', 'Fields': {}}
+        for name in ('Domain', 'Key'):
+            if name in message_json:
+                self.record[name] = message_json[name]
+        self.updates = 0
+
+def update(ws, message_json):
+    global raw_count
+    key = (ws, message_json['ID'])
+    with lock:
+        raw_count += 1
+        item = pending.get(key)
+        if item is None:
+            item = pending[key] = ConflatedUpdate(message_json)
+        item.record['Fields'].update(message_json.get('Fields', {}))
+        item.updates += 1
+    if time.time() >= next_emit:
+        emit()
+
+# Refresh or closed Status supersedes any Fields not yet emitted
+def discard(ws, streamID):
+    with lock:
+        pending.pop((ws, streamID), None)
+
+# Emit a conflated Update for each item updated in the interval
+def emit():
+    global pending, emitted_count, next_emit
+    with lock:
+        items = pending
+        pending = {}
+        emitted_count += len(items)
+        next_emit = time.time() + interval
+    if write:
+        for item in items.values():
+            item.record['ConflatedUpdates'] = item.updates
+            output.write(codec.dumps(item.record))
+
+# Called by the engine so items are still emitted when Updates stop arriving
+def emit_if_due():
+    if pending and (time.time() >= next_emit):
+        emit()
+
+def print_stats():
+    print("Conflation; Raw Updates: {} \tConflated: {} \tSaved: {:.1f}% \tInterval: {:.0f}ms".format(
+        raw_count, emitted_count, (raw_count - emitted_count) * 100.0 / raw_count if raw_count else 0,
+        interval * 1000))
@@ -0,0 +1,117 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Control socket - add, remove or reissue items on the running connections """
+
+import queue
+import threading
+import socketserver
+import market_data
+import profiler
+
+# Commands received - executed by the engine via process_commands(), and the result sent back
+# to the client. The asyncio engine runs them on its loop, the threaded engine on its main loop
+# alongside the websocket thread - so market_data takes its lock to change the connection state
+commands = queue.Queue()
+
+# Split the command argument into (Domain, RIC) entries - Domain is None if not specified
+def parse_entries(arg):
+    entries = []
+    for name in arg.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if '|' in name:
+            domain, ric = name.split('|', 1)
+            entries.append((int(domain), ric.strip()))
+        else:
+            entries.append((None, name))
+    return entries
+
+def execute(line):
+    verb, _, arg = line.partition(' ')
+    verb = verb.lower()
+    if verb == 'stats':
+        market_data.print_stats()
+        return 'OK'
+    if verb == 'profile':
+        return profile(arg.strip().lower())
+    if verb not in ('add', 'remove', 'reissue'):
+        return 'ERR unknown command - use add, remove, reissue, profile or stats'
+    try:
+        entries = parse_entries(arg)
+    except ValueError:
+        return 'ERR Domain must be numeric e.g. 7|VOD.L'
+    if not entries:
+        return 'ERR no RICs specified'
+    if not market_data.connections:
+        return 'ERR not connected'
+    if verb == 'add':
+        count = market_data.add_items(entries)
+    elif verb == 'remove':
+        count = market_data.remove_items(entries)
+    else:
+        count = market_data.reissue_items(entries)
+    print("Control; {} {} items".format(verb, count))
+    return 'OK {} {} items'.format(verb, count)
+
+# Start a profiling window - for the given seconds, or the -prw default - or stop it and write the files
+def profile(arg):
+    if arg == 'stop':
+        filenames = profiler.stop()
+        return 'OK written {}'.format(', '.join(filenames)) if filenames else 'ERR not profiling'
+    try:
+        secs = int(arg) if arg else None
+    except ValueError:
+        return 'ERR use profile [seconds] or profile stop'
+    return 'OK profiling' if profiler.start(secs) else 'ERR already profiling'
+
+# Command waiting for the engine to run it
+class Command:
+    __slots__ = ('line', 'result', 'done')
+
+    def __init__(self, line):
+        self.line = line
+        self.result = None
+        self.done = threading.Event()
+
+# Run the queued commands - called by the engine
+def process_commands():
+    while True:
+        try:
+            command = commands.get_nowait()
+        except queue.Empty:
+            return
+        command.result = execute(command.line)
+        command.done.set()
+
+class ControlHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').strip()
+            if not line:
+                continue
+            command = Command(line)
+            commands.put(command)
+            if command.done.wait(10):
+                self.wfile.write((command.result + '\n').encode('utf-8'))
+            else:
+                self.wfile.write(b'ERR timed out waiting for the engine\n')
+
+class ControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+# Accept control connections on localhost from a background thread
+def start(port, host='localhost'):
+    server = ControlServer((host, port), ControlHandler)
+    thread = threading.Thread(target=server.serve_forever, name='ControlServer', daemon=True)
+    thread.start()
+    print("Control commands accepted on {}:{} - add / remove / reissue RICs".format(host, port))
+    return server
@@ -0,0 +1,141 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Multiple ADS endpoints - items spread by consistent hashing and moved to the surviving endpoints on failure """
+
+import hashlib
+from bisect import bisect
+
+enabled = False     # Items spread across several endpoints - set when -H lists more than one host
+
+REPLICAS = 500      # Points on the ring per endpoint - evens out the share of items each gets
+
+ring = None         # HashRing of the endpoint names
+by_name = {}        # Endpoint name -> Endpoint
+by_ws = {}          # Session -> Endpoint
+
+def hash_key(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+# Each endpoint owns the arcs of the ring ending at its points - a RIC belongs to the first
+# point clockwise from its hash, so removing an endpoint only moves the RICs it owned
+class HashRing:
+
+    def __init__(self, names, replicas=REPLICAS):
+        points = sorted((hash_key('{}#{}'.format(name, i)), name) for name in names for i in range(replicas))
+        self.hashes = [point[0] for point in points]
+        self.names = [point[1] for point in points]
+
+    # Endpoint for the key - skipping any that are down. None if all are down
+    def lookup(self, key, down=()):
+        start = bisect(self.hashes, hash_key(key))
+        for i in range(len(self.names)):
+            name = self.names[(start + i) % len(self.names)]
+            if name not in down:
+                return name
+        return None
+
+class Endpoint:
+    __slots__ = ('name', 'ws', 'up', 'items', 'refreshes', 'updates', 'statuses', 'frames', 'bytes',
+                 'failures', 'moved_in', 'moved_out')
+
+    def __init__(self, name, ws):
+        self.name = name
+        self.ws = ws
+        self.up = True
+        self.items = 0          # Open items when last seen - the session drops them once closed
+        self.refreshes = 0
+        self.updates = 0
+        self.statuses = 0
+        self.frames = 0
+        self.bytes = 0
+        self.failures = 0
+        self.moved_in = 0       # Items moved here from failed endpoints
+        self.moved_out = 0      # Items moved away when this endpoint failed
+
+# 'host[:port],host[:port]...' -> ['host:port', ...] with any duplicates dropped
+def parse(hosts, default_port):
+    names = []
+    for host in hosts.split(','):
+        host = host.strip()
+        if not host:
+            continue
+        if ':' not in host:
+            host = '{}:{}'.format(host, default_port)
+        if host not in names:
+            names.append(host)
+    return names
+
+# Endpoint names with the session connected to each
+def setup(names, sessions):
+    global enabled, ring
+    enabled = True
+    ring = HashRing(names)
+    for name, ws in zip(names, sessions):
+        by_name[name] = by_ws[ws] = Endpoint(name, ws)
+
+# Selects the (Domain, RIC) entries hashed to an endpoint when all are up - for its RicSource
+def owns(name):
+    return lambda entry: ring.lookup(entry[1]) == name
+
+def down_names():
+    return set(endpoint.name for endpoint in by_name.values() if not endpoint.up)
+
+# Session now serving the RIC - None if all the endpoints are down
+def owner(ric):
+    name = ring.lookup(ric, down_names())
+    return by_name[name].ws if name is not None else None
+
+def is_up(ws):
+    return by_ws[ws].up
+
+def all_down():
+    return not any(endpoint.up for endpoint in by_name.values())
+
+# Session closed - its open items are kept for the stats
+def closed(ws, items):
+    by_ws[ws].items = items
+
+def mark_down(ws):
+    endpoint = by_ws[ws]
+    endpoint.up = False
+    endpoint.items = 0
+    endpoint.failures += 1
+
+# Logged in again - new items can be moved here, items already moved elsewhere stay put
+def mark_up(ws):
+    by_ws[ws].up = True
+
+def moved(from_ws, to_ws, count):
+    by_ws[from_ws].moved_out += count
+    by_ws[to_ws].moved_in += count
+
+def received(ws, length):
+    endpoint = by_ws[ws]
+    endpoint.frames += 1
+    endpoint.bytes += length
+
+def refresh(ws):
+    by_ws[ws].refreshes += 1
+
+def update(ws):
+    by_ws[ws].updates += 1
+
+def status(ws):
+    by_ws[ws].statuses += 1
+
+# open_items(ws) gives the number of items open on a session - None once the session has closed
+def print_stats(open_items):
+    for endpoint in by_name.values():
+        items = open_items(endpoint.ws)
+        if items is not None:
+            endpoint.items = items
+        print("Endpoint; {:<24} {:<5} \tItems: {} \tRefresh: {} \tUpdates: {} \tStatus: {} \tBytes: {} \tFailures: {} \tMoved in: {} out: {}"
+              .format(endpoint.name, 'Up' if endpoint.up else 'Down', endpoint.items, endpoint.refreshes,
+                      endpoint.updates, endpoint.statuses, endpoint.bytes, endpoint.failures,
+                      endpoint.moved_in, endpoint.moved_out))
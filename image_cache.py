@@ -0,0 +1,114 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Last value cache of item images - Refresh Fields with the Update Fields merged in """
+
+import os
+import sys
+import codec
+
+enabled = False     # Cache the item images - set by -ic
+
+# Field values are held in a list per item, positioned by a field index shared
+# by all the items - far more compact than a dict of Fields per item
+field_index = {}    # Field name -> position in ItemImage.values
+field_names = []    # Position -> Field name
+MISSING = None      # Value for Fields not (yet) received for an item
+
+by_stream = {}      # websocket -> {StreamID -> ItemImage}
+by_ric = {}         # (RIC, Domain) -> ItemImage
+
+class ItemImage:
+    __slots__ = ('stream_id', 'ric', 'domain', 'values', 'complete', 'updates')
+
+    def __init__(self, stream_id, ric, domain):
+        self.stream_id = stream_id
+        self.ric = ric
+        self.domain = domain
+        self.values = []
+        self.complete = False   # Last Refresh part was Complete - next Refresh replaces the image
+        self.updates = 0        # Updates merged since the last Refresh
+
+    # Merge Fields into the image
+    def merge(self, fields):
+        values = self.values
+        for name, value in fields.items():
+            pos = field_index.get(name)
+            if pos is None:
+                pos = field_index[name] = len(field_names)
+                field_names.append(name)
+            if pos >= len(values):
+                values.extend([MISSING] * (pos + 1 - len(values)))
+            values[pos] = value
+
+    def fields(self):
+        return {field_names[pos]: value for pos, value in enumerate(self.values) if value is not MISSING}
+
+# Refresh received - start a new image, or add the next part of a multi part Refresh
+def refresh(ws, message_json):
+    stream_id = message_json['ID']
+    streams = by_stream.get(ws)
+    if streams is None:
+        streams = by_stream[ws] = {}
+    image = streams.get(stream_id)
+    if image is None:
+        key = message_json.get('Key', {})
+        image = ItemImage(stream_id, key.get('Name'), message_json.get('Domain', 'MarketPrice'))
+        streams[stream_id] = image
+        by_ric[(image.ric, image.domain)] = image
+    elif image.complete:
+        image.values = []
+        image.updates = 0
+    image.merge(message_json.get('Fields', {}))
+    image.complete = message_json.get('Complete', True)
+
+# Update received - merge into the current image
+def update(ws, message_json):
+    streams = by_stream.get(ws)
+    if streams is not None:
+        image = streams.get(message_json['ID'])
+        if image is not None:
+            image.merge(message_json.get('Fields', {}))
+            image.updates += 1
+
+# Item closed - drop its image, unless a later stream for the same RIC has replaced it
+def remove(ws, stream_id):
+    image = by_stream.get(ws, {}).pop(stream_id, None)
+    if (image is not None) and (by_ric.get((image.ric, image.domain)) is image):
+        del by_ric[(image.ric, image.domain)]
+
+# Connection has gone - its StreamIDs are no longer valid
+def remove_connection(ws):
+    by_stream.pop(ws, None)
+
+# Approximate memory used by the cached images
+def memory_used():
+    total = sys.getsizeof(by_ric)
+    for streams in list(by_stream.values()):
+        total += sys.getsizeof(streams)
+    for image in list(by_ric.values()):
+        total += sys.getsizeof(image) + sys.getsizeof(image.values)
+    return total
+
+def print_stats():
+    items = len(by_ric)
+    used = memory_used()
+    print("Images; Items: {} \tFields: {} \tMemory: {:.1f}KB \tPer Item: {} bytes"
+        .format(items, len(field_names), used / 1024.0, used // items if items else 0))
+
+# Write the current images to file - one JSON object per line
+# Written to a temporary file first so a reader never sees a partial dump
+def dump(filename):
+    tmp_name = filename + '.tmp'
+    with open(tmp_name, 'w') as f:
+        for image in list(by_ric.values()):
+            f.write(codec.dumps({'ID': image.stream_id, 'Key': {'Name': image.ric},
+                                 'Domain': image.domain, 'Updates': image.updates,
+                                 'Fields': image.fields()}))
+            f.write('\n')
+    os.replace(tmp_name, filename)
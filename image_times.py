@@ -0,0 +1,150 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Time to image of each item - from its Batch request being sent to its complete Refresh or closed Status """
+
+import os
+import csv
+import time
+import heapq
+from latency import Histogram
+
+enabled = False     # Time each item - set by -tti
+slowest_n = 10      # Number of slowest items to report
+
+pending = {}        # websocket -> {StreamID -> ItemTime} awaiting the complete Refresh or closed Status
+results = {}        # (RIC, Domain) -> ItemTime of the first response to each item
+
+class ItemTime:
+    __slots__ = ('ric', 'domain', 'sent', 'first_part', 'image', 'parts', 'outcome')
+
+    def __init__(self, ric, domain, sent):
+        self.ric = ric
+        self.domain = domain
+        self.sent = sent
+        self.first_part = None  # Secs to the first part of a multi part Refresh
+        self.image = None       # Secs to the complete Refresh or closed Status
+        self.parts = 0
+        self.outcome = None     # 'Image' or the State Text of a closed Status
+
+# Batch sent - StreamIDs from first_id onwards are the RICs in order
+def sent(ws, first_id, domain, rics):
+    streams = pending.get(ws)
+    if streams is None:
+        streams = pending[ws] = {}
+    now = time.perf_counter()
+    domain = str(domain) if domain is not None else 'MarketPrice'   # Server default when no Domain is sent
+    for stream_id, ric in enumerate(rics, first_id):
+        streams[stream_id] = ItemTime(ric, domain, now)
+
+def _responded(ws, stream_id, outcome):
+    item = pending.get(ws, {}).pop(stream_id, None)
+    if item is not None:
+        item.image = time.perf_counter() - item.sent
+        item.outcome = outcome
+        if item.first_part is None:
+            item.first_part = item.image
+        results.setdefault((item.ric, item.domain), item)   # Keep the first e.g. not the resubscribe after a reconnect
+
+# Refresh part received - the item has its image once the Complete part arrives
+def refresh(ws, message_json):
+    item = pending.get(ws, {}).get(message_json['ID'])
+    if item is None:
+        return
+    item.parts += 1
+    if message_json.get('Complete', True):
+        _responded(ws, message_json['ID'], 'Image')
+    elif item.first_part is None:
+        item.first_part = time.perf_counter() - item.sent
+
+def closed(ws, message_json):
+    _responded(ws, message_json['ID'], message_json['State'].get('Text', 'Closed'))
+
+# Item closed by us before it responded - not reported as no response
+def cancel(ws, stream_id):
+    pending.get(ws, {}).pop(stream_id, None)
+
+# Connection has gone - the items will be timed again when resubscribed
+def remove_connection(ws):
+    pending.pop(ws, None)
+
+# Per item times written as CSV - so a later run can be compared e.g. cold vs warm cache
+def save(filename):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['RIC', 'Domain', 'ImageSecs', 'FirstPartSecs', 'Parts', 'Outcome'])
+        for item in results.values():
+            writer.writerow([item.ric, item.domain, '{:.6f}'.format(item.image),
+                             '{:.6f}'.format(item.first_part), item.parts, item.outcome])
+    os.replace(tmp_filename, filename)
+    print('Time to image of {} items written to "{}"'.format(len(results), filename))
+
+# (RIC, Domain) -> image secs of the items that got an image in a saved run
+def load(filename):
+    with open(filename, newline='') as f:
+        return {(row['RIC'], row['Domain']): float(row['ImageSecs'])
+                for row in csv.DictReader(f) if row['Outcome'] == 'Image'}
+
+def format_histogram(label, hist):
+    return ("ImageTime; {:<14} Count: {} \tp50: {:.3f}ms \tp90: {:.3f}ms \tp99: {:.3f}ms \tmax: {:.3f}ms"
+        .format(label, hist.total(), hist.percentile(50) / 1000.0, hist.percentile(90) / 1000.0,
+                hist.percentile(99) / 1000.0, hist.max_value / 1000.0))
+
+# Distribution of this run against the items in common with a previous run
+def print_comparison(filename):
+    try:
+        previous = load(filename)
+    except (OSError, KeyError, ValueError) as error:
+        print('Could not read the previous time to image file "{}": {}'.format(filename, error))
+        return
+    before = Histogram()
+    after = Histogram()
+    faster = 0
+    for key, item in results.items():
+        secs = previous.get(key)
+        if (secs is None) or (item.outcome != 'Image'):
+            continue
+        before.record(secs)
+        after.record(item.image)
+        if item.image < secs:
+            faster += 1
+    common = before.total()
+    print('ImageTime; Compared with "{}" - {} items in both runs, {} faster this run'
+          .format(filename, common, faster))
+    if not common:
+        return
+    print(format_histogram('Previous run', before))
+    print(format_histogram('This run', after))
+    print("ImageTime; Difference     p50: {:+.3f}ms \tp90: {:+.3f}ms \tp99: {:+.3f}ms".format(
+        *[(after.percentile(pct) - before.percentile(pct)) / 1000.0 for pct in (50, 90, 99)]))
+
+# Report at exit - distribution, slowest items and any comparison with a previous run
+def print_report(compare_filename=None):
+    waiting = sum(len(streams) for streams in pending.values())
+    images = [item for item in results.values() if item.outcome == 'Image']
+    print("ImageTime; Items: {} \tImages: {} \tClosed: {} \tNo response: {}"
+          .format(len(results) + waiting, len(images), len(results) - len(images), waiting))
+    image_hist = Histogram()
+    first_hist = Histogram()
+    for item in images:
+        image_hist.record(item.image)
+        if item.parts > 1:
+            first_hist.record(item.first_part)
+    if images:
+        print(format_histogram('Complete image', image_hist))
+    if first_hist.total():
+        print(format_histogram('First part', first_hist))
+    slowest = heapq.nlargest(slowest_n, images, key=lambda item: item.image)
+    if slowest:
+        print("ImageTime; Slowest {} items:".format(len(slowest)))
+        for item in slowest:
+            print("  {:<24} {:<14} {:>10.3f}ms \tParts: {} \t{}".format(
+                item.ric, item.domain, item.image * 1000.0, item.parts, item.outcome))
+    if compare_filename:
+        print_comparison(compare_filename)
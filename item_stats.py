@@ -0,0 +1,82 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" StreamID to RIC index with per item Update counts - reports the busiest and quietest items """
+
+import time
+import heapq
+
+enabled = False     # Keep per item stats - set by -top
+top_n = 10          # Number of busiest / quietest items to report
+
+by_stream = {}      # websocket -> {StreamID -> ItemStats}
+last_report = 0     # When the previous report was printed
+
+class ItemStats:
+    __slots__ = ('ric', 'domain', 'updates', 'reported', 'refreshed')
+
+    def __init__(self, ric, domain):
+        self.ric = ric
+        self.domain = domain
+        self.updates = 0        # Updates since the first Refresh
+        self.reported = 0       # Updates at the previous report
+        self.refreshed = time.time()
+
+# Refresh received - index the StreamID assigned by the server to the RIC
+def refresh(ws, message_json):
+    streams = by_stream.get(ws)
+    if streams is None:
+        streams = by_stream[ws] = {}
+    stream_id = message_json['ID']
+    if stream_id not in streams:
+        key = message_json.get('Key', {})
+        streams[stream_id] = ItemStats(key.get('Name'), message_json.get('Domain', 'MarketPrice'))
+
+def update(ws, message_json):
+    streams = by_stream.get(ws)
+    if streams is not None:
+        item = streams.get(message_json['ID'])
+        if item is not None:
+            item.updates += 1
+
+# Item closed - no longer reported
+def remove(ws, stream_id):
+    streams = by_stream.get(ws)
+    if streams is not None:
+        streams.pop(stream_id, None)
+
+def remove_connection(ws):
+    by_stream.pop(ws, None)
+
+def _format_item(item, interval, now):
+    return ("  {:<24} {:<14} {:>10.2f} upd/s \tTotal: {} \tAvg: {:.2f} upd/s"
+        .format(item.ric, item.domain, (item.updates - item.reported) / interval, item.updates,
+                item.updates / max(now - item.refreshed, 0.001)))
+
+# Print the items with the highest and lowest Update rates since the previous report
+def print_stats(label=""):
+    global last_report
+    now = time.time()
+    items = [item for streams in list(by_stream.values()) for item in list(streams.values())]
+    if not items:
+        return
+    interval = max(now - last_report, 0.001) if last_report else max(now - min(i.refreshed for i in items), 0.001)
+    interval_updates = lambda item: item.updates - item.reported
+    busiest = heapq.nlargest(top_n, items, key=interval_updates)
+    quietest = heapq.nsmallest(top_n, items, key=interval_updates)
+
+    print("{}Busiest {} of {} items:".format(label, len(busiest), len(items)))
+    for item in busiest:
+        print(_format_item(item, interval, now))
+    print("{}Quietest {} of {} items:".format(label, len(quietest), len(items)))
+    for item in quietest:
+        print(_format_item(item, interval, now))
+
+    for item in items:
+        item.reported = item.updates
+    last_report = now
@@ -0,0 +1,119 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Fixed bucket latency histograms - reported as p50/p90/p99/max with the stats """
+
+from array import array
+
+SUB_BITS = 6                    # 2^(SUB_BITS-1) sub buckets per power of 2 i.e. ~3% precision
+MAX_BITS = 40                   # Up to 2^40 microseconds (~12 days)
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+BUCKETS = SUB_COUNT + (MAX_BITS - SUB_BITS) * HALF_COUNT
+
+# The histograms we record - fixed so shard workers can publish them to the parent
+NAMES = ('on_message parse', 'process Refresh', 'process Update', 'process Status',
+         'process Ping', 'process Other', 'Request to Refresh', 'Pipeline backlog',
+         'Order book apply')
+PROCESS_NAMES = {'Refresh': 'process Refresh', 'Update': 'process Update',
+                 'Status': 'process Status', 'Ping': 'process Ping'}
+
+enabled = False     # Record latencies - set by -lat
+
+# HDR style histogram of microsecond values
+# Values below SUB_COUNT are exact, above that each power of 2 range is split into HALF_COUNT buckets
+class Histogram:
+    __slots__ = ('counts', 'max_value')
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * BUCKETS))
+        self.max_value = 0
+
+    def record(self, secs):
+        usecs = int(secs * 1000000)
+        if usecs > self.max_value:
+            self.max_value = usecs
+        self.counts[bucket_index(usecs)] += 1
+
+    def total(self):
+        return sum(self.counts)
+
+    # Value at the given percentile - upper bound of the bucket, capped at the max recorded
+    def percentile(self, pct):
+        total = self.total()
+        if total == 0:
+            return 0
+        wanted = max(1, int(total * pct / 100.0 + 0.5))
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bucket_upper(idx), self.max_value)
+        return self.max_value
+
+    # Add the counts from another histogram e.g. from a shard worker
+    def merge(self, counts, max_value):
+        for idx, count in enumerate(counts):
+            if count:
+                self.counts[idx] += count
+        if max_value > self.max_value:
+            self.max_value = max_value
+
+def bucket_index(usecs):
+    if usecs < SUB_COUNT:
+        return usecs
+    shift = usecs.bit_length() - SUB_BITS
+    idx = SUB_COUNT + (shift - 1) * HALF_COUNT + (usecs >> shift) - HALF_COUNT
+    return idx if idx < BUCKETS else BUCKETS - 1
+
+def bucket_upper(idx):
+    if idx < SUB_COUNT:
+        return idx
+    shift = (idx - SUB_COUNT) // HALF_COUNT + 1
+    mantissa = (idx - SUB_COUNT) % HALF_COUNT + HALF_COUNT
+    return ((mantissa + 1) << shift) - 1
+
+histograms = {name: Histogram() for name in NAMES}
+
+def record(name, secs):
+    histograms[name].record(secs)
+
+# Format the percentiles of a histogram in milliseconds
+def format_histogram(name, hist):
+    return ("Latency; {:<20} Count: {} \tp50: {:.3f}ms \tp90: {:.3f}ms \tp99: {:.3f}ms \tmax: {:.3f}ms"
+        .format(name, hist.total(), hist.percentile(50) / 1000.0, hist.percentile(90) / 1000.0,
+                hist.percentile(99) / 1000.0, hist.max_value / 1000.0))
+
+def print_latency(hists=None):
+    if hists is None:
+        hists = histograms
+    for name in NAMES:
+        if hists[name].total():
+            print(format_histogram(name, hists[name]))
+
+# Size of the flat array used by a shard worker to publish its histograms - counts + max for each
+SHARED_SIZE = len(NAMES) * (BUCKETS + 1)
+
+def publish(shared):
+    pos = 0
+    for name in NAMES:
+        hist = histograms[name]
+        shared[pos:pos + BUCKETS] = hist.counts.tolist()
+        shared[pos + BUCKETS] = hist.max_value
+        pos += BUCKETS + 1
+
+# Merge the histograms published by the shard workers
+def merge_shared(shared_list):
+    merged = {name: Histogram() for name in NAMES}
+    for shared in shared_list:
+        values = shared[:]
+        pos = 0
+        for name in NAMES:
+            merged[name].merge(values[pos:pos + BUCKETS], values[pos + BUCKETS])
+            pos += BUCKETS + 1
+    return merged
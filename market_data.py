@@ -12,11 +12,29 @@ import sys
 import time
 import getopt
 import socket
-import json
 import websocket
 import threading
+import latency
+import codec
+import output
+import image_cache
+import item_stats
+import column_export
+import conflation
+import order_book
+import image_times
+import ramp
+import wire
+import pipeline
+import profiler
+import metrics
+import capture
+import reconnect
+import ric_source
+import endpoints
+import token_manager
 from threading import Thread, Event
-from collections import defaultdict
+from collections import deque
 
 # Global Default Variables for connection
 hostname = 'localhost'      # Data server 
@@ -24,22 +42,26 @@ port = '15000'              # Data server port
 ping_timeout_interval = 30  # How often do we expect to recieve Ping from server
 ping_timeout_time = 0       # If not received a Ping by this time then timeout and exit
 start_time = 0              # Time when first Market Data request made
+all_responded_time = 0      # Time when all requested items had responded
 
 # Other Global default variables
 user = 'user'       # Default username for ADS login
 app_id = '256'      # Default application ID for login
 position = socket.gethostbyname(socket.gethostname())
-simpleRicList = []    # List of RICs to request
-domainRicList =[]   # List of RICs with Domain specified
+ricSource = None    # RicSource of the RICs to request - with or without Domain specified
 viewList = []   # List of Fields (FIDs or Names) to use in View Request
 domainModel = None  # Websocket interface defaults to MarketPrice if not specified
 serviceName = None  # RDP or ADS typically has a default service configured
 snapshot = False    # Make Snapshot request (rather than the default streaming)
 dumpRcvd = False    # Dump messages received from server
+dumpPretty = False  # Pretty print the dumped messages - rather than the raw frame received
 dumpPP = False      # Dump the incoming Ping and outgoing Pong messages
 dumpSent = False    # Dump out the Requests to the SENT to the server
 dumpStatus = False  # Dump out any Status Msgs received from server
 autoExit = False    # Exit once Refresh (or Status closed) received for all requests
+batchSize = 0       # Max RICs per Batch request (0 = all RICs in one Batch per Domain)
+maxOutstanding = 0  # Max items awaiting Refresh/closed Status before next Batch sent (0 = no limit)
+trackItems = False  # Keep the StreamID of each open item - to resubscribe (-rc) or close them (-cp)
 
 reqCnt = 0      # Number of Data Items requested
 imgCnt = 0      # Data Refresh messages received
@@ -47,22 +69,62 @@ updCnt = 0      # Update messages received
 statusCnt = 0   # Status messages received
 pingCnt = 0     # Ping messages (= Pongs sent)
 closedCnt = 0   # Specifically Closed status message (e.g. item not found)
+byteCnt = 0     # Bytes of JSON received - UTF-8 encoded, not characters
 logged_in = False # Did we get a successful Login response yet
 
 auth_token = None       # Autorization token for RDP connections
 web_socket_app = None   
 web_socket_open = False
 shutdown_app = False    # flag to indicate shutdown
+shutdown_callback = None    # Optional function called when shutdown signalled e.g. to wake an event loop
 rdp_mode = False        # Are connecting to RDP
+connections = {}        # Per connection request state - keyed by websocket
+# Held while the connection request state is changed - by the thread processing the received
+# messages and, with the threaded engine, by the main loop running control commands and ramp steps
+lock = threading.RLock()
+
+PONG_MESSAGE = codec.dumps({ 'Type':'Pong' })  # Same Pong every time - so encode once
 
 # Dump some basic stats to console
 def print_stats():
-    global imgCnt, updCnt, statusCnt, pingCnt, start_time
+    print(format_stats(imgCnt, updCnt, statusCnt, pingCnt, start_time))
+    metrics.print_rates()
+    if output.dropped():
+        print("Output; Dropped lines: {}".format(output.dropped()))
+    if image_cache.enabled:
+        image_cache.print_stats()
+    if item_stats.enabled:
+        item_stats.print_stats()
+    if latency.enabled:
+        latency.print_latency()
+    if conflation.enabled:
+        conflation.print_stats()
+    if order_book.enabled:
+        order_book.print_stats()
+    if pipeline.enabled:
+        pipeline.print_stats()
+    if wire.enabled:
+        wire.print_stats()
+    if reconnect.enabled:
+        reconnect.print_stats()
+    if endpoints.enabled:
+        endpoints.print_stats(lambda ws: len(connections[ws].items) if ws in connections else None)
+    if token_manager.manager is not None:
+        token_manager.print_stats()
+
+# Format a stats line - also used to report aggregated / per shard stats
+def format_stats(img, upd, status, ping, started, label="Stats"):
     elapsed = 0
-    if (start_time!=0):
-        elapsed = time.time() - start_time
-    print("Stats; Refresh: {} \tUpdates: {} \tStatus: {} \tPings: {} \tElapsed Time: {:.2f}secs"
-        .format(imgCnt,updCnt,statusCnt,pingCnt, elapsed))
+    if (started!=0):
+        elapsed = time.time() - started
+    return ("{}; Refresh: {} \tUpdates: {} \tStatus: {} \tPings: {} \tElapsed Time: {:.2f}secs"
+        .format(label, img, upd, status, ping, elapsed))
+
+# Snapshot of the counters - in the order of STAT_FIELDS
+# Used by shard worker processes to publish their stats to the parent
+STAT_FIELDS = ('reqCnt', 'imgCnt', 'updCnt', 'statusCnt', 'pingCnt', 'closedCnt', 'byteCnt', 'start_time')
+def get_counts():
+    return (reqCnt, imgCnt, updCnt, statusCnt, pingCnt, closedCnt, byteCnt, start_time)
 
 # Various Login related parameters
 def set_Login(u,a,p,t,e):
@@ -74,13 +136,69 @@ def set_Login(u,a,p,t,e):
     rdp_mode=e
 
 # Data request related parameters
-def set_Request_Attr(service,rList,rdm,snap, dmList):
-    global simpleRicList,domainModel,snapshot, domainRicList, serviceName
+def set_Request_Attr(service,source,rdm,snap):
+    global ricSource,domainModel,snapshot, serviceName
     serviceName=service
-    simpleRicList=rList
+    ricSource=source
     domainModel=rdm
     snapshot=snap
-    domainRicList=dmList
+
+# Batch size and outstanding request window
+def set_Batch_Attr(size, outstanding):
+    global batchSize, maxOutstanding
+    batchSize=size
+    maxOutstanding=outstanding
+
+# Request state for a single connection - several connections can share this process
+class Connection:
+    __slots__ = ('source', 'batches', 'requested', 'pending', 'awaiting', 'next_stream_id', 'request_times',
+                 'items', 'relogin', 'lost_time', 'attempts', 'reconnect_time',
+                 'recovery_items', 'recovery_left', 'recovery_unsent', 'recovery_end')
+
+    def __init__(self, source):
+        self.source = source        # RicSource of the RICs to request on this connection
+        self.batches = None         # Iterator of (Domain, RICs) Batches read lazily from the source
+        self.requested = False      # Have we started requesting our items yet
+        self.pending = deque()      # (Domain, RICs) Batches taken from batches but not yet sent
+        self.awaiting = set()       # StreamIDs of items awaiting Refresh or closed Status
+        self.next_stream_id = 2     # Next free StreamID - Login uses 1
+        self.request_times = {}     # StreamID -> time Batch sent, until first Refresh (latency only)
+        self.items = {} if trackItems else None  # StreamID -> (Domain, RIC) of open items
+        self.relogin = False        # Connection lost after items requested - resubscribe once logged in again
+        self.lost_time = 0          # When the connection was last lost
+        self.attempts = 0           # Reconnect attempts since the connection was lost
+        self.reconnect_time = 0     # When to make the next reconnect attempt
+        self.recovery_items = 0     # Items being resubscribed
+        self.recovery_left = 0      # Resubscribed items still to respond
+        self.recovery_unsent = 0    # Resubscribed items at the front of pending - not yet requested
+        self.recovery_end = 0       # StreamIDs below this are resubscribed items
+
+# RICs to request on a specific connection - rather than the RICs set by set_Request_Attr
+def set_session_rics(ws, source):
+    connections[ws] = Connection(source)
+
+def get_connection(ws):
+    conn = connections.get(ws)
+    if conn is None:
+        conn = connections[ws] = Connection(ricSource)
+    return conn
+
+# Next Batch to send - read from the RIC source only once the earlier Batches have gone
+def peek_batch(conn):
+    if (not conn.pending) and (conn.batches is not None):
+        batch = next(conn.batches, None)
+        if batch is None:
+            conn.batches = None
+        else:
+            conn.pending.append(batch)
+    return conn.pending[0] if conn.pending else None
+
+# All item requests sent and all items have responded
+def all_responded():
+    for conn in connections.values():
+        if (not conn.requested) or (peek_batch(conn) is not None):
+            return False
+    return reqCnt==imgCnt+closedCnt
 
 # View used to request Field filtering by the server
 def set_viewList(vList):
@@ -88,11 +206,17 @@ def set_viewList(vList):
     viewList=vList
     #print("Set viewList to", viewList, "from", vList)
 
+# Flag shutdown to the main loop - and wake it up if it has asked to be told
+def signal_shutdown():
+    global shutdown_app
+    shutdown_app = True
+    if shutdown_callback:
+        shutdown_callback()
+
 # Attempt clean shutdown
 def cleanup(ws):
-    global shutdown_app
     send_login_close(ws)
-    shutdown_app=True   # signal to main loop to exit
+    signal_shutdown()   # signal to main loop to exit
     #ws.close()     # Cannot use due to Websocket client issue/bug
 
 # Call this each time we send or receive a message 
@@ -109,7 +233,7 @@ def ping_timedout():
 
 # Process the JSON message received from server
 def process_message(ws, message_json):
-    global imgCnt, updCnt, statusCnt, pingCnt, closedCnt,shutdown_app
+    global imgCnt, updCnt, statusCnt, closedCnt
 
     # Get Message Type
     message_type = message_json['Type']
@@ -123,98 +247,442 @@ def process_message(ws, message_json):
         if message_domain == "Login":
             process_login_response(ws, message_json)
         else:   
+            if latency.enabled or ramp.enabled:
+                request_to_refresh(ws, message_json['ID'])
+            if image_cache.enabled:
+                image_cache.refresh(ws, message_json)
+            if item_stats.enabled:
+                item_stats.refresh(ws, message_json)
+            if column_export.enabled:
+                column_export.refresh(ws, message_json)
+            if conflation.enabled:
+                conflation.discard(ws, message_json['ID'])
+            if order_book.enabled and ('Map' in message_json):
+                order_book.refresh(ws, message_json)
+            if image_times.enabled:
+                image_times.refresh(ws, message_json)
             if not (('Complete' in message_json) and    # Default value for Complete is True
                 (message_json['Complete']==False)) :    # Only count Refresh If 'Complete' not present or present as True
                 imgCnt += 1     # Only for Data related Refresh i.e. not Login
+                if endpoints.enabled:
+                    endpoints.refresh(ws)
+                item_responded(ws, message_json['ID'])
+                if message_json['State']['Stream'] != 'Open':     # e.g. Snapshot - nothing to resubscribe
+                    item_closed(ws, message_json['ID'])
     elif message_type == "Update":
         updCnt += 1
+        if endpoints.enabled:
+            endpoints.update(ws)
+        if image_cache.enabled:
+            image_cache.update(ws, message_json)
+        if item_stats.enabled:
+            item_stats.update(ws, message_json)
+        if conflation.enabled:
+            conflation.update(ws, message_json)
+        if order_book.enabled and ('Map' in message_json):
+            order_book.update(ws, message_json)
     elif message_type == "Status":
         # Count Data Item Status msg received
         if message_domain != "Login":
             statusCnt += 1
+            if endpoints.enabled:
+                endpoints.status(ws)
             stream_state = message_json['State']['Stream']
             data_state = message_json['State']['Data']
             # Was the item request rejected by server & stream Closed?
             if stream_state=='Closed' and data_state=='Suspect':
                 closedCnt += 1
+                item_responded(ws, message_json['ID'])
+            if stream_state!='Open':
+                item_closed(ws, message_json['ID'])
+                if conflation.enabled:
+                    conflation.discard(ws, message_json['ID'])
+                if image_cache.enabled:
+                    image_cache.remove(ws, message_json['ID'])
+                if item_stats.enabled:
+                    item_stats.remove(ws, message_json['ID'])
+                if order_book.enabled:
+                    order_book.remove(ws, message_json['ID'])
+                if image_times.enabled:
+                    image_times.closed(ws, message_json)
             if dumpStatus and not dumpRcvd:     # if dumpRCVD set then Status will be dumped elsewhere
-                print(json.dumps(message_json))
+                output.write(codec.dumps(message_json))
         else:
             print("LOGIN STATUS:")      # Login status usually a problem - so report it and return
-            print(json.dumps(message_json, sort_keys=True, indent=2, separators=(',', ':')))
+            print(codec.dumps_pretty(message_json))
             if message_json['State']['Stream'] != "Open" or message_json['State']['Data'] != "Ok":
                 print("Login Request rejected / failed.")
-                shutdown_app=True
-        return
+                signal_shutdown()
+            return
     
     elif message_type == "Ping":    # If we get a Ping from the Server
-        pingCnt += 1                # we need to respond with a Pong 
-        pong_json = { 'Type':'Pong' }
-        ws.send(json.dumps(pong_json))
-        if (dumpPP):
-            print("RCVD:", json.dumps(message_json),
-                    " SENT:", json.dumps(pong_json))
+        process_ping(ws, message_json)
+
+    elif message_type == "Pong":    # Response to our own Ping
+        if ramp.enabled:
+            ramp.pong(ws)
 
     elif message_type == 'Error':   # Oh Dear - server did not like our Request
         print("ERR: ")
-        print(json.dumps(message_json, sort_keys=True, indent=2, separators=(',', ':')))
+        print(codec.dumps_pretty(message_json))
         cleanup(ws)
 
     # Cleanup and exit - if autoExit and we have received response to all requests
-    if (autoExit and (reqCnt==imgCnt+closedCnt)):
+    if (autoExit and all_responded()):
         cleanup(ws)
 
+# We need to respond to a Ping with a Pong
+def process_ping(ws, message_json):
+    global pingCnt
+    pingCnt += 1
+    send_text(ws, PONG_MESSAGE)
+    if (dumpPP):
+        output.write("RCVD:", codec.dumps(message_json),
+                     " SENT:", PONG_MESSAGE)
+
+# Time from Batch request to the first Refresh for the item
+def request_to_refresh(ws, streamID):
+    conn = connections.get(ws)
+    if conn is not None:
+        sent = conn.request_times.pop(streamID, None)
+        if sent is not None:
+            if latency.enabled:
+                latency.record('Request to Refresh', time.perf_counter() - sent)
+            if ramp.enabled:
+                ramp.image_latency(time.perf_counter() - sent)
+
+# Item has responded with its Refresh or closed Status
+# so make room in the outstanding window for the next Batch
+def item_responded(ws, streamID):
+    conn = connections.get(ws)
+    if conn is not None and streamID in conn.awaiting:
+        conn.awaiting.discard(streamID)
+        conn.request_times.pop(streamID, None)
+        if conn.recovery_left and (streamID < conn.recovery_end):
+            conn.recovery_left -= 1
+            if not conn.recovery_left:
+                recovered(conn)
+        if peek_batch(conn) is not None:
+            send_pending_requests(ws, conn)
+        elif (not conn.awaiting) and (not all_responded_time) and all_responded():
+            report_all_responded()
+
+# Item stream closed by the server - so not resubscribed on reconnect
+def item_closed(ws, streamID):
+    conn = connections.get(ws)
+    if conn is not None and conn.items is not None:
+        conn.items.pop(streamID, None)
+
+# Time taken for all the items to respond - reported once
+def report_all_responded():
+    global all_responded_time
+    all_responded_time = time.time()
+    print("All {} items responded in {:.2f}secs".format(reqCnt, all_responded_time - start_time))
+
 # We received a Login Refresh Response from Server - success!
 def process_login_response(ws, message_json):
     
     global ping_timeout_interval, start_time, logged_in
 
     logged_in = True
+    if endpoints.enabled:
+        endpoints.mark_up(ws)
 
     # Get Ping timeout interval supplied by server
     ping_timeout_interval = int(message_json['Elements']['PingTimeout'])
 
+    # Login Refresh in response to a token reissue - items already requested
+    conn = get_connection(ws)
+    if conn.requested and not conn.relogin:
+        return
+
     # Get the Login StreamID and increment - ready for Data request
-    next_stream_id = int(message_json['ID']) + 1
+    conn.next_stream_id = int(message_json['ID']) + 1
 
     # For statistics - we start timing after Login 
     # and just before we send our data requests
-    start_time = time.time()
+    if start_time == 0:
+        start_time = time.time()
     """ Send item request """
-    if (domainRicList):
-        send_multi_domain_data_request(ws, next_stream_id)
-    else:
-        send_single_domain_data_request(ws, domainModel, simpleRicList, next_stream_id)
-
-# User specified '-ef' and file with multiple domain types
-# So we need to group RICs by Domain and make a batch request for each group
-def send_multi_domain_data_request(ws, streamID):
-
-    """ Group Market Data request by Domain type """
-    """ and then make batch request for each group """
-    grouped = defaultdict(list)
-    # Create lists grouped by Domain Type
-    for domain, ric in domainRicList:
-        grouped[domain].append(ric)
-    
-    #print(grouped)
-
-    # For each Domain type group, call the data request method
-    for i, (domain, rics) in enumerate(grouped.items()):
-        send_single_domain_data_request(ws, domain, rics, i + streamID)
-        # Server allocates unique StreamID to each item in a Batch
+    if conn.relogin:        # Logged in again after reconnect - resubscribe Batches are already pending
+        conn.relogin = False
+        conn.attempts = 0
+        reconnect.record_outage(time.time() - conn.lost_time)
+        if not conn.recovery_left:
+            recovered(conn)
+    elif conn.source is not None:
+        conn.batches = conn.source.batches(request_batch_size())
+    conn.requested = True
+    send_pending_requests(ws, conn)
+
+# StreamIDs of a lost connection are no longer valid - drop what is held against them
+def remove_stream_state(ws):
+    if image_cache.enabled:
+        image_cache.remove_connection(ws)
+    if item_stats.enabled:
+        item_stats.remove_connection(ws)
+    if order_book.enabled:
+        order_book.remove_connection(ws)
+    if image_times.enabled:
+        image_times.remove_connection(ws)
+
+# Connection lost and we are going to reconnect - queue the open items to resubscribe in Batches
+# ahead of any not yet requested, and schedule the next attempt with backoff
+def connection_lost(ws):
+    global reqCnt, ping_timeout_time, logged_in
+    conn = get_connection(ws)
+    logged_in = False
+    ping_timeout_time = 0
+    remove_stream_state(ws)
+    if conn.requested and not conn.relogin:
+        conn.relogin = True
+        conn.lost_time = time.time()
+        reqCnt -= len(conn.awaiting)    # Will be requested again
+        conn.awaiting.clear()
+        conn.request_times.clear()
+        resubscribe = list(ric_source.group_batches(conn.items.values(), request_batch_size()))
+        conn.items.clear()
+        conn.pending.extendleft(reversed(resubscribe))
+        conn.recovery_unsent += sum(len(rics) for domain, rics in resubscribe)
+        conn.recovery_items = conn.recovery_left = conn.recovery_unsent
+        conn.recovery_end = 0
+    delay = reconnect.backoff(conn.attempts)
+    conn.attempts += 1
+    conn.reconnect_time = time.time() + delay
+    print("Reconnect attempt {} in {:.2f}secs".format(conn.attempts, delay))
+
+# Endpoint has failed - move its items to the surviving endpoints by consistent hashing
+# Only the failed endpoint's items are requested again - those on the other endpoints are left alone
+# Its open, pending and not yet read items all move, so a reconnect to it has nothing to resubscribe
+def failover(ws):
+    global reqCnt
+    endpoints.mark_down(ws)
+    conn = get_connection(ws)
+    entries = list(conn.items.values())
+    for domain, rics in conn.pending:
+        entries.extend((domain, ric) for ric in rics)
+    if conn.batches is not None:
+        entries.extend((domain, ric) for domain, rics in conn.batches for ric in rics)
+    elif (not conn.requested) and (conn.source is not None):    # Failed before it logged in
+        entries.extend(conn.source.items())
+    reqCnt -= len(conn.awaiting)    # Will be requested on the other endpoints
+    conn.awaiting.clear()
+    conn.request_times.clear()
+    conn.items.clear()
+    conn.pending.clear()
+    conn.batches = None
+    conn.source = None
+    conn.requested = True
+    conn.recovery_items = conn.recovery_left = conn.recovery_unsent = 0
+    remove_stream_state(ws)
+
+    moved = {}
+    for entry in dict.fromkeys(entries):
+        target = endpoints.owner(entry[1])
+        if target is not None:
+            moved.setdefault(target, []).append(entry)
+    for target, target_entries in moved.items():
+        target_conn = get_connection(target)
+        target_conn.pending.extend(ric_source.group_batches(target_entries, request_batch_size()))
+        endpoints.moved(ws, target, len(target_entries))
+        if target_conn.requested and not target_conn.relogin:    # Otherwise sent once logged in
+            send_pending_requests(target, target_conn)
+    count = sum(len(target_entries) for target_entries in moved.values())
+    print("Endpoint {} failed - {} items moved to {} other endpoints{}".format(
+        endpoints.by_ws[ws].name, count, len(moved),
+        "" if count == len(entries) else ", {} dropped as no endpoint is up".format(len(entries) - count)))
+
+# Add items on the running connections - to the one with fewest open items, requested in Batches
+# or with multiple endpoints to the endpoint each RIC hashes to. Items already open are skipped
+# Returns the number of items added
+def add_items(entries):
+    with lock:
+        open_items = set()
+        for c in connections.values():
+            open_items.update(c.items.values())
+        entries = [entry for entry in dict.fromkeys(entries) if entry not in open_items]
+        targets = {}
+        if endpoints.enabled:
+            for entry in entries:
+                target = endpoints.owner(entry[1])
+                if target in connections:
+                    targets.setdefault(target, []).append(entry)
+        else:
+            targets[min(connections, key=lambda ws: len(connections[ws].items))] = entries
+        for ws, target_entries in targets.items():
+            conn = connections[ws]
+            conn.pending.extend(ric_source.group_batches(target_entries, request_batch_size()))
+            if conn.requested and not conn.relogin:     # Otherwise sent once logged in
+                send_pending_requests(ws, conn)
+        return sum(len(target_entries) for target_entries in targets.values())
+
+# Matcher for (Domain, RIC) entries - an entry with no Domain matches the RIC in any Domain
+def entry_matcher(entries):
+    wanted = set(entries)
+    rics = set(ric for domain, ric in entries if domain is None)
+    return lambda item: (item in wanted) or (item[1] in rics)
+
+# StreamIDs of the open items on a connection matching (Domain, RIC) entries - no Domain matches any Domain
+def find_items(conn, entries):
+    matches = entry_matcher(entries)
+    return [(streamID, item) for streamID, item in conn.items.items() if matches(item)]
+
+# (Domain, RICs) Batches without the matching RICs - Batches left empty are dropped
+def without_items(batches, matches):
+    for domain, rics in batches:
+        kept = [ric for ric in rics if not matches((domain, ric))]
+        if kept:
+            yield domain, kept
+
+# Drop the matching items not yet requested on a connection - both those in the pending Batches
+# and those still to be read from the RIC source. Returns the number dropped from the pending Batches
+def purge_pending(conn, matches):
+    purged = recovery_purged = 0
+    position = 0
+    for domain, rics in conn.pending:
+        for ric in rics:
+            if matches((domain, ric)):
+                purged += 1
+                if position < conn.recovery_unsent:     # A resubscribe - no longer expected to recover
+                    recovery_purged += 1
+            position += 1
+    if purged:
+        conn.pending = deque(without_items(conn.pending, matches))
+    if recovery_purged:
+        conn.recovery_unsent -= recovery_purged
+        conn.recovery_items -= recovery_purged
+        conn.recovery_left -= recovery_purged
+        if (not conn.recovery_left) and (not conn.relogin):
+            recovered(conn)
+    if conn.batches is not None:
+        conn.batches = without_items(conn.batches, matches)
+    return purged
+
+# Close the matching open items, and drop any not yet requested. Returns the number of items removed
+def remove_items(entries):
+    global reqCnt
+    with lock:
+        matches = entry_matcher(entries)
+        count = 0
+        for ws, conn in list(connections.items()):
+            count += purge_pending(conn, matches)
+            if conn.relogin:    # Nothing open to close - any resubscribes were purged above
+                continue
+            found = [(streamID, item) for streamID, item in conn.items.items() if matches(item)]
+            if not found:
+                continue
+            for streamID, item in found:
+                del conn.items[streamID]
+                if conflation.enabled:
+                    conflation.discard(ws, streamID)
+                if image_cache.enabled:
+                    image_cache.remove(ws, streamID)
+                if item_stats.enabled:
+                    item_stats.remove(ws, streamID)
+                if order_book.enabled:
+                    order_book.remove(ws, streamID)
+                if image_times.enabled:
+                    image_times.cancel(ws, streamID)
+                if streamID in conn.awaiting:   # No longer expecting a response
+                    conn.awaiting.discard(streamID)
+                    conn.request_times.pop(streamID, None)
+                    reqCnt -= 1
+            send_item_close(ws, [streamID for streamID, item in found])
+            count += len(found)
+            if peek_batch(conn) is not None:    # May have made room in the outstanding window
+                send_pending_requests(ws, conn)
+        return count
+
+# Request a new Refresh on the matching open items - on their existing StreamIDs
+# Returns the number of items reissued
+def reissue_items(entries):
+    with lock:
+        count = 0
+        for ws, conn in list(connections.items()):
+            if conn.relogin:
+                continue
+            for streamID, (domain, ric) in find_items(conn, entries):
+                if streamID in conn.awaiting:   # Refresh already on its way
+                    continue
+                conn.awaiting.add(streamID)
+                send_single_domain_data_request(ws, domainModel if domain is None else domain, ric, streamID)
+                count += 1
+        return count
+
+# Connection is now known by a new websocket e.g. a new WebSocketApp for the reconnect
+def move_connection(old_ws, new_ws):
+    with lock:
+        conn = connections.pop(old_ws, None)
+        if conn is not None:
+            conn.reconnect_time = 0
+            connections[new_ws] = conn
+
+# All resubscribed items have responded
+def recovered(conn):
+    reconnect.record_recovery(time.time() - conn.lost_time, conn.recovery_items)
+
+# Max RICs per Batch - user specified '-ef' and file with multiple domain types
+# so the RIC source groups RICs by Domain and we make batch requests for each group
+def request_batch_size():
+    size = batchSize
+    if (maxOutstanding>0) and ((size==0) or (size>maxOutstanding)):
+        size = maxOutstanding   # A Batch larger than the window would never be sent
+    if ramp.enabled and ((size==0) or (size>ramp.step_items)):
+        size = ramp.step_items  # nor would one larger than a ramp step
+    return size
+
+# Ramp step - send any Batches now allowed. Returns True while there are items still to request
+def request_more():
+    with lock:
+        more = False
+        for ws, conn in list(connections.items()):
+            if (not conn.requested) or conn.relogin:    # Sent once logged in
+                more = True
+            elif peek_batch(conn) is not None:
+                send_pending_requests(ws, conn)
+                more = more or (peek_batch(conn) is not None)
+        return more
+
+# Send Batches while there is room in the outstanding request window
+def send_pending_requests(ws, conn):
+    while peek_batch(conn) is not None:
+        domain, rics = conn.pending[0]
+        if ((maxOutstanding>0) and conn.awaiting and
+                (len(conn.awaiting) + len(rics) > maxOutstanding)):
+            break
+        if ramp.enabled and (not conn.recovery_unsent) and (not ramp.allow(len(rics))):
+            break   # Wait for the next ramp step - resubscribes are not held back
+        conn.pending.popleft()
+        # Server allocates unique StreamID to each item in a Batch - Batch StreamID + 1 onwards
         # so we need to increment StreamID appropriately for next request
-        streamID += len(rics)   
+        streamID = conn.next_stream_id
+        conn.next_stream_id += len(rics) + 1
+        conn.awaiting.update(range(streamID + 1, streamID + 1 + len(rics)))
+        if conn.items is not None:
+            conn.items.update(zip(range(streamID + 1, streamID + 1 + len(rics)),
+                                  ((domain, ric) for ric in rics)))
+        if conn.recovery_unsent:    # Resubscribe Batches are sent first
+            conn.recovery_unsent -= len(rics)
+            conn.recovery_end = conn.next_stream_id
+        if domain is None:      # Simple RICs use the -md Domain
+            domain = domainModel
+        if image_times.enabled:
+            image_times.sent(ws, streamID + 1, domain, rics)
+        if latency.enabled or ramp.enabled:
+            conn.request_times.update(dict.fromkeys(range(streamID + 1, streamID + 1 + len(rics)),
+                                                    time.perf_counter()))
+        send_single_domain_data_request(ws, domain, rics, streamID)
 
 
 # Make a Batch request for all the RICs in ricList 
 # with any specified Views and Domains etc. 
+# or a single RIC request e.g. a reissue on an existing stream
 def send_single_domain_data_request(ws, domain, ricList, streamID):
     global reqCnt
     """ Create and send Market Data request for a single Domain type"""
     
     # increment the data items requested count
-    reqCnt += len(ricList)
+    reqCnt += len(ricList) if isinstance(ricList, list) else 1
 
     mp_req_json = {
         'ID': streamID,
@@ -239,10 +707,19 @@ def send_single_domain_data_request(ws, domain, ricList, streamID):
         mp_req_json['Streaming'] = False
 
     # Send the Data request to the server
-    ws.send(json.dumps(mp_req_json))
+    send_json(ws, mp_req_json)
     if (dumpSent):
-        print("SENT MP Request:")
-        print(json.dumps(mp_req_json, sort_keys=True, indent=2, separators=(',', ':')))
+        output.write("SENT MP Request:")
+        output.write(codec.dumps_pretty(mp_req_json))
+
+# Encode and send a message to the server
+def send_json(ws, message_json):
+    send_text(ws, codec.dumps(message_json))
+
+def send_text(ws, text):
+    if wire.enabled:
+        wire.sent(codec.encoded_length(text))
+    ws.send(text)
 
 # Refreshed auth token so send login request again
 def reissue_token(ws, token):
@@ -279,10 +756,21 @@ def send_login_request(ws, is_refresh_token=False):
     else:   # TREP ADS connection
         login_json['Key']['Name'] = user
     
-    ws.send(json.dumps(login_json))
+    send_json(ws, login_json)
     if (dumpSent):
-        print("SENT Login Request:")
-        print(json.dumps(login_json, sort_keys=True, indent=2, separators=(',', ':')))
+        output.write("SENT Login Request:")
+        output.write(codec.dumps_pretty(login_json))
+
+# Close item streams - one message for all the StreamIDs
+def send_item_close(ws, streamIDs):
+    close_json = {
+        'ID': streamIDs if len(streamIDs)>1 else streamIDs[0],
+        'Type': 'Close'
+    }
+    send_json(ws, close_json)
+    if (dumpSent):
+        output.write("SENT Close Request:")
+        output.write(codec.dumps_pretty(close_json))
 
 # Send a Logout request to server - with StreamID 1
 def send_login_close(ws):
@@ -291,36 +779,129 @@ def send_login_close(ws):
         'ID': 1,
         'Type': 'Close'
     }
-    ws.send(json.dumps(logout_json))
+    send_json(ws, logout_json)
     if (dumpSent):
-        print("SENT Logout Request:")
-        print(json.dumps(logout_json, sort_keys=True, indent=2, separators=(',', ':')))
+        output.write("SENT Logout Request:")
+        output.write(codec.dumps_pretty(logout_json))
 
 # Received a JSON message payload from server
 def on_message(ws, message):
     """ Called when message received, parse message into JSON for processing """
-    message_json = json.loads(message)
+    global byteCnt
+    length = codec.encoded_length(message)
+    byteCnt += length
+    if wire.enabled:
+        wire.received(length)
+    if endpoints.enabled:
+        endpoints.received(ws, length)
+    if capture.writer is not None:
+        capture.record(message)
+    if pipeline.enabled:    # Processed by the pipeline worker thread - unless only Pings
+        if not ((len(message) <= PING_FRAME_MAX) and ('Ping' in message) and answer_pings(ws, message)):
+            pipeline.put(ws, message)
+        reset_ping_time()
+        return
+    process_frame(ws, message)
+
+# Parse a frame into its JSON array of messages
+def parse_frame(message):
+    message_json = codec.loads(message)
+    if wire.enabled:
+        wire.recv_messages += len(message_json)
+    return message_json
+
+PING_FRAME_MAX = 128    # In pipeline mode, frames this size or smaller are checked for Pings on the receive thread
+
+# Frame holding only Ping(s) - answered on the receive thread, so not held up behind the queued frames
+# Any other frame is passed on to the pipeline and its messages counted when it is parsed there
+def answer_pings(ws, message):
+    message_json = codec.loads(message)
+    if not all(singleMsg.get('Type') == 'Ping' for singleMsg in message_json):
+        return False
+    if wire.enabled:
+        wire.recv_messages += len(message_json)
     if dumpRcvd:
-        print("RCVD: ")
-        print(json.dumps(message_json, sort_keys=True, indent=2, separators=(',', ':')))
-
-    # extract and process individual messages
+        output.write("RCVD: ")
+        output.write(codec.dumps_pretty(message_json) if dumpPretty else message)
     for singleMsg in message_json:
-        process_message(ws, singleMsg)
-    # We have received a message from server - so reset the Ping timeout
-    reset_ping_time()
+        process_ping(ws, singleMsg)
+    pipeline.fast_pongs += 1
+    return True
+
+# Parse the frame and process each of the messages in it
+# record(name, secs) - when given - is passed the parse time as 'parse' and each message's process time as its Type
+def process_frame(ws, message, record=None):
+    with lock:
+        if record is None:
+            if profiler.active:
+                profiler.run(on_message_profiled, ws, message)
+                return
+            if latency.enabled:
+                on_message_timed(ws, message)
+                return
+            message_json = parse_frame(message)
+        else:
+            started = time.perf_counter()
+            message_json = parse_frame(message)
+            record('parse', time.perf_counter() - started)
+        if dumpRcvd:
+            output.write("RCVD: ")
+            output.write(codec.dumps_pretty(message_json) if dumpPretty else message)
+
+        # extract and process individual messages
+        for singleMsg in message_json:
+            if record is None:
+                process_message(ws, singleMsg)
+            else:
+                started = time.perf_counter()
+                process_message(ws, singleMsg)
+                record(singleMsg.get('Type'), time.perf_counter() - started)
+        # We have received a message from server - so reset the Ping timeout
+        reset_ping_time()
+
+def record_latency(name, secs):
+    if name == 'parse':
+        latency.record('on_message parse', secs)
+    else:
+        latency.record(latency.PROCESS_NAMES.get(name, 'process Other'), secs)
+
+def record_profile(name, secs):
+    profiler.count(name, secs)
+    if latency.enabled:
+        record_latency(name, secs)
+
+# As on_message but recording parse and per message type process latencies
+def on_message_timed(ws, message):
+    process_frame(ws, message, record_latency)
+
+# As on_message_timed but also counting the calls and time per message Type for the profiler
+def on_message_profiled(ws, message):
+    process_frame(ws, message, record_profile)
 
 def on_error(ws, error):
     """ Called when websocket error has occurred """
     print(error)
 
 
-def on_close(ws):
-    """ Called when websocket is closed """
-    global web_socket_open, shutdown_app
-    print("WebSocket Closed")
-    web_socket_open = False
-    shutdown_app = True
+def on_close(ws, *args):
+    """ Called when websocket is closed - websocket-client also passes the close status code and reason """
+    global web_socket_open
+    with lock:
+        print("WebSocket Closed")
+        web_socket_open = False
+        if endpoints.enabled:
+            endpoints.closed(ws, len(get_connection(ws).items))
+        if endpoints.enabled and not shutdown_app:
+            if endpoints.is_up(ws):     # Not for each failed reconnect attempt
+                failover(ws)
+            if reconnect.enabled:
+                connection_lost(ws)
+            elif endpoints.all_down():
+                signal_shutdown()
+        elif reconnect.enabled and not shutdown_app:
+            connection_lost(ws)
+        else:
+            signal_shutdown()
 
 def on_open(ws):
     """ Called when handshake is complete and websocket is open, send login """
@@ -0,0 +1,126 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Windowed message rates - exported as JSON lines and a Prometheus text endpoint """
+
+import time
+import threading
+from collections import deque
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import codec
+
+# Counters we track rates for - name used in the exports -> market_data counter
+RATES = (('refreshes', 'imgCnt'), ('updates', 'updCnt'), ('status', 'statusCnt'),
+         ('pings', 'pingCnt'), ('bytes', 'byteCnt'))
+
+window_secs = 60    # Moving average window
+
+# Per second rate of a cumulative counter, with moving average and peak
+class RateWindow:
+    __slots__ = ('samples', 'total', 'rate', 'peak', 'last_time')
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.total = 0
+        self.rate = 0.0
+        self.peak = 0.0
+        self.last_time = 0
+
+    def sample(self, total, now):
+        if self.last_time and now > self.last_time:
+            self.rate = (total - self.total) / (now - self.last_time)
+            self.samples.append(self.rate)
+            if self.rate > self.peak:
+                self.peak = self.rate
+        self.total = total
+        self.last_time = now
+
+    def average(self):
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+windows = {}
+lock = threading.Lock()     # Samples are taken on the main thread, read by the HTTP thread
+
+# Take a sample of the cumulative counters - dict keyed by market_data counter name
+def sample(counts):
+    now = time.time()
+    with lock:
+        for name, counter in RATES:
+            window = windows.get(name)
+            if window is None:
+                window = windows[name] = RateWindow(window_secs)
+            window.sample(counts.get(counter, 0), now)
+
+def snapshot():
+    result = {'time': round(time.time(), 3)}
+    with lock:
+        for name, counter in RATES:
+            window = windows.get(name)
+            if window is None:
+                continue
+            result[name] = window.total
+            result[name + '_per_sec'] = round(window.rate, 2)
+            result[name + '_per_sec_avg'] = round(window.average(), 2)
+            result[name + '_per_sec_peak'] = round(window.peak, 2)
+    return result
+
+# Current, average and peak rates for the stats output
+def print_rates():
+    with lock:
+        if not windows:
+            return
+        print("Rates; " + " \t".join("{}: {:.1f}/s (avg {:.1f} peak {:.1f})"
+            .format(name.capitalize(), windows[name].rate, windows[name].average(), windows[name].peak)
+            for name in ('refreshes', 'updates', 'bytes') if name in windows))
+
+# Append the current totals and rates to a JSON lines file
+def write_json_line(filename):
+    with open(filename, 'a') as f:
+        f.write(codec.dumps(snapshot()))
+        f.write('\n')
+
+# Prometheus text exposition format
+def prometheus_text():
+    lines = []
+    with lock:
+        for name, counter in RATES:
+            window = windows.get(name)
+            if window is None:
+                continue
+            metric = 'wstestclient_' + name
+            lines.append('# TYPE {}_total counter'.format(metric))
+            lines.append('{}_total {}'.format(metric, window.total))
+            lines.append('# TYPE {}_per_second gauge'.format(metric))
+            lines.append('{}_per_second {:.2f}'.format(metric, window.rate))
+            lines.append('{}_per_second_avg{{window="{}s"}} {:.2f}'.format(metric, window_secs, window.average()))
+            lines.append('{}_per_second_peak {:.2f}'.format(metric, window.peak))
+    return '\n'.join(lines) + '\n'
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass    # Keep scrapes out of the console output
+
+# Serve /metrics on localhost from a background thread
+def start_http_server(port, host='localhost'):
+    server = HTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True)
+    thread.start()
+    print("Serving metrics on http://{}:{}/metrics".format(host, port))
+    return server
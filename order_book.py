@@ -0,0 +1,178 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Order books - MarketByOrder / MarketByPrice Map entries applied to sorted price levels per stream """
+
+import time
+from bisect import bisect_left
+import latency
+
+enabled = False     # Build the order books - set by -ob
+
+PRICE_FIELD = 'ORDER_PRC'
+SIDE_FIELD = 'ORDER_SIDE'
+SIZE_FIELDS = ('ORDER_SIZE', 'ACC_SIZE')    # Size of a MarketByOrder order / MarketByPrice level
+BID_SIDES = ('BID', 'B', 1)                 # ORDER_SIDE enum - as display string or value
+
+by_stream = {}      # websocket -> {StreamID -> OrderBook}
+
+actions = 0         # Map entries applied
+apply_secs = 0.0    # Time spent applying them
+max_apply = 0.0     # Longest to apply a single message
+unplaced = 0        # Entries without a price - so could not be put on a level
+
+last_stats_time = 0.0   # For the actions/sec since the last stats
+last_stats_actions = 0
+
+# One side of a book - price levels kept sorted best first, so the top of book is prices[0]
+# Bid prices are held negated so both sides sort ascending
+class BookSide:
+    __slots__ = ('prices', 'levels')
+
+    def __init__(self):
+        self.prices = []    # Sort keys of the levels - best first
+        self.levels = {}    # Sort key -> [size, entries]
+
+    def add(self, sort_key, size):
+        level = self.levels.get(sort_key)
+        if level is None:
+            self.levels[sort_key] = [size, 1]
+            self.prices.insert(bisect_left(self.prices, sort_key), sort_key)
+        else:
+            level[0] += size
+            level[1] += 1
+
+    def remove(self, sort_key, size):
+        level = self.levels[sort_key]
+        level[1] -= 1
+        if level[1] == 0:
+            del self.levels[sort_key]
+            del self.prices[bisect_left(self.prices, sort_key)]
+        else:
+            level[0] -= size
+
+class OrderBook:
+    __slots__ = ('entries', 'bids', 'asks', 'complete')
+
+    def __init__(self):
+        self.entries = {}       # Map Key -> (bid, price, size) of each order / level
+        self.bids = BookSide()
+        self.asks = BookSide()
+        self.complete = False   # Last Refresh part was Complete - next Refresh replaces the book
+
+    def clear(self):
+        self.entries.clear()
+        self.bids = BookSide()
+        self.asks = BookSide()
+
+    def remove_entry(self, entry):
+        bid, price, size = entry
+        if bid:
+            self.bids.remove(-price, size)
+        else:
+            self.asks.remove(price, size)
+
+    # Add or Update - an Update only needs to carry the Fields that changed
+    def set(self, key, fields):
+        global unplaced
+        old = self.entries.get(key)
+        bid, price, size = old if old is not None else (True, None, 0)
+        side = fields.get(SIDE_FIELD)
+        if side is not None:
+            bid = side in BID_SIDES
+        price = fields.get(PRICE_FIELD, price)
+        for name in SIZE_FIELDS:
+            if name in fields:
+                size = fields[name] or 0
+                break
+        if price is None:
+            unplaced += 1
+            return
+        if old is not None:
+            self.remove_entry(old)
+        self.entries[key] = (bid, price, size)
+        if bid:
+            self.bids.add(-price, size)
+        else:
+            self.asks.add(price, size)
+
+    def delete(self, key):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.remove_entry(old)
+
+    # Apply the Map entries - returns the number applied
+    def apply(self, entries):
+        for entry in entries:
+            if entry.get('Action') == 'Delete':
+                self.delete(entry.get('Key'))
+            else:
+                self.set(entry.get('Key'), entry.get('Fields') or {})
+        return len(entries)
+
+    def depth(self):
+        return max(len(self.bids.prices), len(self.asks.prices))
+
+def apply(book, message_json):
+    global actions, apply_secs, max_apply
+    started = time.perf_counter()
+    actions += book.apply(message_json['Map'].get('Entries', ()))
+    elapsed = time.perf_counter() - started
+    apply_secs += elapsed
+    if elapsed > max_apply:
+        max_apply = elapsed
+    if latency.enabled:
+        latency.record('Order book apply', elapsed)
+
+# Refresh received - start a new book, or add the next part of a multi part Refresh
+def refresh(ws, message_json):
+    streams = by_stream.get(ws)
+    if streams is None:
+        streams = by_stream[ws] = {}
+    book = streams.get(message_json['ID'])
+    if book is None:
+        book = streams[message_json['ID']] = OrderBook()
+    elif book.complete:
+        book.clear()
+    apply(book, message_json)
+    book.complete = message_json.get('Complete', True)
+
+# Update received - apply to the current book
+def update(ws, message_json):
+    streams = by_stream.get(ws)
+    if streams is not None:
+        book = streams.get(message_json['ID'])
+        if book is not None:
+            apply(book, message_json)
+
+# Item closed - drop its book
+def remove(ws, streamID):
+    streams = by_stream.get(ws)
+    if streams is not None:
+        streams.pop(streamID, None)
+
+# Connection has gone - its StreamIDs are no longer valid
+def remove_connection(ws):
+    by_stream.pop(ws, None)
+
+def print_stats():
+    global last_stats_time, last_stats_actions
+    books = [book for streams in list(by_stream.values()) for book in list(streams.values())]
+    entries = sum(len(book.entries) for book in books)
+    levels = sum(len(book.bids.prices) + len(book.asks.prices) for book in books)
+    max_depth = max((book.depth() for book in books), default=0)
+    now = time.time()
+    rate = (actions - last_stats_actions) / (now - last_stats_time) if last_stats_time else 0
+    last_stats_time = now
+    last_stats_actions = actions
+    print("OrderBook; Books: {} \tEntries: {} \tPrice levels: {} (avg depth {:.1f} max {}) \tActions: {} ({:.1f}/s)"
+          " \tApply: avg {:.2f}us per action, max {:.3f}ms per message"
+          .format(len(books), entries, levels, levels / (2.0 * len(books)) if books else 0, max_depth,
+                  actions, rate, apply_secs * 1e6 / actions if actions else 0, max_apply * 1000))
+    if unplaced:
+        print("OrderBook; Entries without an {} - not placed: {}".format(PRICE_FIELD, unplaced))
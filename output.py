@@ -0,0 +1,89 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Background writer for the -X / -sos / -sp / -ss message output """
+
+import sys
+import queue
+import threading
+
+POLICIES = ('block', 'drop', 'sample')
+MAX_BATCH = 1000    # Max lines joined into a single write
+
+writer = None       # Active OutputWriter - when None output is printed directly
+
+# Collects output lines from the WebSocket thread into a bounded queue
+# and writes them to the console / log file in large batches from its own thread
+# When the queue is full: 'block' waits for room, 'drop' discards the line
+# and 'sample' keeps 1 in sample_rate of the lines and discards the rest
+class OutputWriter(threading.Thread):
+
+    def __init__(self, stream, queue_size, policy='block', sample_rate=10):
+        threading.Thread.__init__(self, name='OutputWriter', daemon=True)
+        self.stream = stream
+        self.lines = queue.Queue(queue_size)
+        self.policy = policy
+        self.sample_rate = max(1, sample_rate)
+        self.overflow = 0   # Lines that found the queue full
+        self.dropped = 0    # Lines discarded due to full queue
+
+    def write(self, line):
+        try:
+            self.lines.put_nowait(line)
+            return
+        except queue.Full:
+            self.overflow += 1
+        if (self.policy == 'block') or ((self.policy == 'sample') and (self.overflow % self.sample_rate == 0)):
+            self.lines.put(line)
+        else:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            line = self.lines.get()
+            batch = []
+            while line is not None:
+                batch.append(line)
+                if len(batch) >= MAX_BATCH:
+                    break
+                try:
+                    line = self.lines.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.stream.write(''.join(batch))
+                self.stream.flush()
+            if line is None:    # Stop requested
+                return
+
+    # Write out anything still queued and stop the thread
+    def stop(self):
+        self.lines.put(None)
+        self.join()
+
+# Start writing output via a background thread
+def start(queue_size, policy='block', sample_rate=10):
+    global writer
+    writer = OutputWriter(sys.stdout, queue_size, policy, sample_rate)
+    writer.start()
+
+def stop():
+    global writer
+    if writer is not None:
+        writer.stop()
+        writer = None
+
+# Same arguments as print() - queued to the writer thread if one is active
+def write(*args):
+    if writer is None:
+        print(*args)
+    else:
+        writer.write(' '.join(map(str, args)) + '\n')
+
+def dropped():
+    return writer.dropped if writer is not None else 0
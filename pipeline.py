@@ -0,0 +1,73 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Pipeline mode - the receive thread queues the frames, a worker thread parses + processes them """
+
+import time
+import queue
+import threading
+import latency
+
+enabled = False     # Set by -pl
+frames = None       # Queue of (websocket, frame, time received) for the worker
+worker = None
+
+fast_pongs = 0      # Pings answered by the receive thread
+max_depth = 0       # Most frames seen waiting in the queue
+last_age = 0.0      # Seconds the last processed frame waited in the queue
+max_age = 0.0
+
+# Called on the receive thread - queue the frame for the worker
+def put(ws, frame):
+    global max_depth
+    frames.put((ws, frame, time.perf_counter()))
+    depth = frames.qsize()
+    if depth > max_depth:
+        max_depth = depth
+
+def run_worker(process, on_error):
+    global last_age, max_age
+    while True:
+        item = frames.get()
+        if item is None:
+            return
+        ws, frame, received = item
+        last_age = time.perf_counter() - received
+        if last_age > max_age:
+            max_age = last_age
+        if latency.enabled:
+            latency.record('Pipeline backlog', last_age)
+        try:
+            process(ws, frame)
+        except Exception as error:  # As websocket-client does for on_message
+            on_error(ws, error)
+
+# Start the worker thread - process(websocket, frame) is called for each queued frame
+def start(queue_size, process, on_error):
+    global enabled, frames, worker
+    enabled = True
+    frames = queue.Queue(queue_size)    # Receive thread blocks when full - rather than run out of memory
+    worker = threading.Thread(target=run_worker, args=(process, on_error), name='Pipeline', daemon=True)
+    worker.start()
+
+# Process the frames already queued and stop the worker
+def stop(timeout=5):
+    if worker is not None:
+        frames.put(None)
+        worker.join(timeout)
+
+# Age of the oldest frame still waiting
+def oldest_age():
+    try:
+        return time.perf_counter() - frames.queue[0][2]
+    except IndexError:
+        return 0.0
+
+def print_stats():
+    print("Pipeline; Queue depth: {} (max {}) \tBacklog age: oldest {:.1f}ms last {:.1f}ms max {:.1f}ms \tFast path Pongs: {}"
+          .format(frames.qsize(), max_depth, oldest_age() * 1000.0, last_age * 1000.0, max_age * 1000.0, fast_pongs))
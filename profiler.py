@@ -0,0 +1,181 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Runtime profiling - a window toggled by SIGUSR1 or the control socket, written to timestamped files """
+
+import os
+import sys
+import time
+import signal
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+mode = 'cprofile'       # 'cprofile' or 'sample' - set by -prm
+prefix = 'profile'      # Profile filenames start with this - set by -prf
+window_secs = 0         # Stop profiling after this many seconds (0=until toggled again) - set by -prw
+trace_memory = False    # Also compare tracemalloc snapshots from the start and end of the window - set by -prt
+
+SAMPLE_SECS = 0.005     # Interval between stack samples in sample mode
+MEMORY_TOP_N = 25       # Allocation sites written to the memory file
+
+active = False          # Profiling window open - checked by market_data for each frame
+toggle_requested = False    # Set by the signal handler, acted on by check() outside the message processing
+lock = threading.Lock()     # Held while a frame is processed in the window, so the window is never written mid frame
+profile = None          # cProfile.Profile of the window - None in sample mode
+sampler = None
+started = 0.0
+stop_time = None        # Window closes automatically at this time - None if open until toggled
+message_counts = {}     # Message Type -> [calls, cumulative secs]
+memory_start = None     # tracemalloc snapshot from the start of the window
+target_thread = None    # Thread processing the messages - its stack is sampled in sample mode
+windows = 0             # Profile windows written
+
+# Stack of the message processing thread sampled at a fixed interval
+# Counted as collapsed stacks i.e. one line per distinct stack - the input flame graph tools expect
+class Sampler(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='ProfileSampler', daemon=True)
+        self.stacks = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(SAMPLE_SECS):
+            frame = sys._current_frames().get(target_thread)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+# Process a frame in the window - called on whichever thread processes the messages
+def run(fn, *args):
+    global target_thread
+    with lock:
+        if not active:      # Window closed while we waited for the lock
+            fn(*args)
+        elif profile is not None:
+            profile.runcall(fn, *args)
+        else:
+            target_thread = threading.get_ident()
+            fn(*args)
+
+# Calls and time for a message Type - called from within run()
+def count(message_type, secs):
+    counts = message_counts.get(message_type)
+    if counts is None:
+        counts = message_counts[message_type] = [0, 0.0]
+    counts[0] += 1
+    counts[1] += secs
+
+# Open a profiling window - closed after secs (or -prw) seconds, 0 to leave open until toggled
+def start(secs=None):
+    global active, profile, sampler, started, stop_time, message_counts, memory_start
+    with lock:
+        if active:
+            return False
+        message_counts = {}
+        profile = None
+        sampler = None
+        if mode == 'sample':
+            sampler = Sampler()
+            sampler.start()
+        else:
+            profile = cProfile.Profile()
+        memory_start = None
+        if trace_memory:
+            tracemalloc.start()
+            memory_start = tracemalloc.take_snapshot()
+        started = time.time()
+        secs = window_secs if secs is None else secs
+        stop_time = started + secs if secs>0 else None
+        active = True
+    print("Profile; {} started{}".format(mode, " for {}secs".format(secs) if secs>0 else ""))
+    return True
+
+def write_counts(filename, elapsed):
+    with open(filename, 'w') as f:
+        f.write("{:<10} {:>10} {:>12} {:>10} {:>10}\n".format('Type', 'Calls', 'Total secs', 'Avg us', 'Calls/s'))
+        for message_type, (calls, secs) in sorted(message_counts.items(), key=lambda c: -c[1][1]):
+            f.write("{:<10} {:>10} {:>12.3f} {:>10.1f} {:>10.1f}\n".format(
+                str(message_type), calls, secs, secs * 1e6 / calls, calls / elapsed if elapsed else 0))
+
+def write_stacks(filename):
+    with open(filename, 'w') as f:
+        for stack, samples in sampler.stacks.most_common():
+            f.write('{} {}\n'.format(stack, samples))
+
+# Allocations made in the window that are still held - by source line
+def write_memory(filename):
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    with open(filename, 'w') as f:
+        for stat in snapshot.compare_to(memory_start, 'lineno')[:MEMORY_TOP_N]:
+            f.write('{}\n'.format(stat))
+
+# Close the window and write its files - returns the filenames, or None if not profiling
+def stop():
+    global active, windows
+    with lock:
+        if not active:
+            return None
+        active = False
+        elapsed = time.time() - started
+        base = '{}-{}'.format(prefix, time.strftime('%Y%m%d-%H%M%S', time.localtime(started)))
+        filenames = [base + '.counts.txt']
+        write_counts(filenames[0], elapsed)
+        if profile is not None:
+            filenames.append(base + '.prof')    # Load with pstats or snakeviz
+            profile.dump_stats(filenames[-1])
+        else:
+            sampler.stop()
+            filenames.append(base + '.stacks.txt')
+            write_stacks(filenames[-1])
+        if memory_start is not None:
+            filenames.append(base + '.memory.txt')
+            write_memory(filenames[-1])
+        windows += 1
+    print("Profile; {:.1f}secs window written to {}".format(elapsed, ', '.join(filenames)))
+    return filenames
+
+def toggle():
+    if active:
+        stop()
+    else:
+        start()
+
+# Called by the engine - act on the signal and close the window when its time is up
+def check():
+    global toggle_requested
+    if toggle_requested:
+        toggle_requested = False
+        toggle()
+    elif active and stop_time and (time.time() >= stop_time):
+        stop()
+
+# Signal handler only flags the toggle, as it may interrupt the processing of a frame
+def on_signal(signum, frame):
+    global toggle_requested
+    toggle_requested = True
+
+# SIGUSR1 toggles profiling - not available on Windows, where the control socket can be used
+def install_signal():
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, on_signal)
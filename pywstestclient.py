@@ -6,16 +6,39 @@
 #|           Copyright Refinitiv 2019. All rights reserved.                  --
 #|-----------------------------------------------------------------------------
 
+import os
 import time
+import signal
 import argparse
 import sys
 import socket
 import getpass
-import requests
 import market_data
 import websocket
-import json
 import threading
+import multiprocessing
+import asyncio
+import async_client
+import latency
+import codec
+import output
+import image_cache
+import item_stats
+import column_export
+import conflation
+import order_book
+import image_times
+import ramp
+import wire
+import pipeline
+import profiler
+import metrics
+import capture
+import reconnect
+import control
+import token_manager
+import ric_source
+import endpoints
 from threading import Thread, Event
 
 # Python example that uses the Refinitiv Websocket interface to facilitate the consumption of realtime data.
@@ -23,61 +46,47 @@ from threading import Thread, Event
 #  RDP or ADS connection, Batch / View Request, Streaming / Snapshot, Reuters Domain Models
 
 # Global Variables
-simpleRics=None
-extRics=None
+ricSource=None
 opts=None
 ws_app=None
 auth_path = 'auth/oauth2/v1/token'
 sts_token = ''
-refresh_token = ''
 client_secret = ''
-expire_time = '0'
-original_expire_time = '0'; 
 scope = 'trapi'
 rdp_mode = False
+periodic_tasks = []     # Run by the engines alongside the stats - (interval in seconds, function)
 
 # Read RICs from file '-f' option i.e. no domain specified 
 # so will be used in conjunction with Domain Model parameter
+# The file is read lazily, a Batch at a time, as the requests are sent
 def readSimpleRicsFile():
-    global simpleRics
-    try:
-        with open(opts.ricFile, 'r') as f:      # Read one RIC per line from file
-            simpleRics = [ric.strip(' \t\n\r') for ric in f]  # and strip any whitespace etc
-    except FileNotFoundError as fnf_error:
-        print(fnf_error)
+    global ricSource
+    if not os.path.isfile(opts.ricFile):
+        print("RIC file not found:", opts.ricFile)
         return
-
-    print("RICs from file:", simpleRics)
+    ricSource = ric_source.RicSource(filename=opts.ricFile)
+    print("RICs from", ricSource.describe())
 
 # Read Domain + RIC from multi domain file '-ef' option
 # File contains Domain Model Number and RIC seperated by | - one per line e..g
 # 6|VOD.L
 # 7|BT.L
+# RICs are grouped by Domain as the file is read lazily, a Batch at a time
 def readExtRicsFile():
-    global extRics
-    try:
-        with open(opts.ricFileExt, 'r') as f:
-            tmpExtRics = f.read().splitlines() # using read.splitlines to strip \n on end of each RIC
-        extRics=[]
-        for xRic in tmpExtRics:
-            tmp = xRic.split("|")
-            try:                    # Add entry as Domain number, RIC
-                extRics.append((int(tmp[0]), str(tmp[1]).strip(' \t\n\r')))  # strip any whitespaces
-            except:pass
-        extRics.sort()
-        print("SORTED:", extRics)
-    except FileNotFoundError as fnf_error:
-        print(fnf_error)
+    global ricSource
+    if not os.path.isfile(opts.ricFileExt):
+        print("Multi Domain RIC file not found:", opts.ricFileExt)
         return
-
-    #print("Read {} Multi Domain RICs from file: {}".format(len(extRics), extRics))
+    ricSource = ric_source.RicSource(filename=opts.ricFileExt, multi_domain=True)
+    print("Multi Domain RICs from", ricSource.describe())
 
 # Only one RIC list specifier allowed; -items OR -f OR -ef
 def parse_rics():
-    global simpleRics
+    global ricSource
     if (opts.itemList):
         simpleRics = opts.itemList.split(',')
         print(simpleRics)
+        ricSource = ric_source.RicSource(rics=simpleRics)
     elif (opts.ricFile):
         readSimpleRicsFile()
     elif (opts.ricFileExt):
@@ -102,6 +111,14 @@ def validate_options():
         print('Only one type of View allowed; -vfids or -vnames')
         return False
 
+    if opts.replayFile:
+        if (opts.processes>1) or opts.asyncEngine or opts.captureFile:
+            print('Replay -replay cannot be used with -np, -async or -rec')
+            return False
+        if not os.path.isfile(opts.replayFile):
+            print('Capture file "{}" not found'.format(opts.replayFile))
+            return False
+
     # Ensure only one RIC list /filename specified by user
     ricLists = (opts.itemList, opts.ricFile, opts.ricFileExt)
     ricListCnt=0
@@ -112,13 +129,15 @@ def validate_options():
     if (ricListCnt>1):
         print('Only one RIC list specifier allowed; -items, -f or -ef')
         return False
+    elif (not ricListCnt) and opts.replayFile:
+        pass    # No RICs needed - the capture holds the responses
     elif (not ricListCnt):
         print('Must specify some RICs using one of the following; -items, -f or -ef')
         return False
     else:
         parse_rics()
         # Check if we parsed some RICs to request. 
-        if (not simpleRics) and (not extRics):
+        if (ricSource is None) or (not ricSource.has_rics()):
             print("Was not able to read any RICs from file or command line")
             return False
 
@@ -126,6 +145,72 @@ def validate_options():
     if (opts.exitTimeMins>0) and (opts.statsTimeSecs > (opts.exitTimeMins*60)):
         opts.statsTimeSecs ==  opts.exitTimeMins*60
 
+    if (opts.batchSize<0) or (opts.maxOutstanding<0):
+        print('Batch size -bs and outstanding requests -mo cannot be negative')
+        return False
+
+    if (opts.outputQueue<0):
+        print('Output queue size -oq cannot be negative')
+        return False
+
+    if (opts.rampItems<0) or (opts.rampSecs<=0) or (min(opts.rampMaxImageMs, opts.rampMaxPingMs, opts.rampMaxErrorPct)<0):
+        print('Ramp step -rmp and thresholds cannot be negative, and interval -rmi must be above 0')
+        return False
+
+    if opts.rampItems and ((opts.processes>1) or opts.replayFile):
+        print('Ramp load test -rmp cannot be used with -np or -replay')
+        return False
+
+    if (opts.imageTimeSlowest<0) or ((opts.imageTimeFile or opts.imageTimeCompare) and not opts.imageTimeSlowest):
+        print('Time to image -tti must be above 0 to use -tts or -ttc')
+        return False
+
+    if (opts.profileWindowSecs<0):
+        print('Profile window -prw cannot be negative')
+        return False
+
+    if opts.compress and not opts.asyncEngine:
+        print('Compression -z requires the asyncio engine -async - websocket-client does not support permessage-deflate')
+        return False
+
+    if (opts.pipelineQueue<0):
+        print('Pipeline queue size -pl cannot be negative')
+        return False
+
+    if opts.pipelineQueue and (opts.asyncEngine or opts.replayFile):
+        print('Pipeline -pl cannot be used with -async or -replay')
+        return False
+
+    if (opts.processes<1):
+        print('Number of processes -np must be at least 1')
+        return False
+
+    if opts.exportFile and column_export.is_parquet(opts.exportFile) and (column_export.pyarrow is None):
+        print('Parquet export -xf requires the pyarrow package')
+        return False
+
+    if (opts.conflateMs<0) or (opts.conflateOutput and not opts.conflateMs):
+        print('Conflation interval -cf must be above 0 to use -cfx')
+        return False
+
+    if opts.controlPort and ((opts.processes>1) or opts.replayFile):
+        print('Control port -cp cannot be used with -np or -replay')
+        return False
+
+    if (opts.reconnectDelay<=0) or (opts.reconnectMaxDelay<opts.reconnectDelay):
+        print('Reconnect delay -rcd must be above 0 and no more than max delay -rcm')
+        return False
+
+    if opts.asyncEngine and (async_client.websockets is None):
+        print('The asyncio engine -async requires the websockets package')
+        return False
+    if (opts.sessions!=1) and ((not opts.asyncEngine) or (opts.sessions<1)):
+        print('Multiple sessions -ns requires the asyncio engine -async')
+        return False
+    if (len(endpoints.parse(opts.host, opts.port))>1) and ((not opts.asyncEngine) or (opts.sessions!=1)):
+        print('Multiple hosts -H requires the asyncio engine -async - with one session per host, so no -ns')
+        return False
+
     # Check if Domain has been specified as a numeric value rather than name
     if opts.domain and opts.domain.isdigit():        
         opts.domain = int(opts.domain)
@@ -141,7 +226,7 @@ def parse_args(args=None):
                         help='service name to request from',
                         default=None)
     parser.add_argument('-H', dest='host',
-                        help='data server hostname / endpoint',
+                        help='data server hostname / endpoint - or a comma separated list of host[:port] to spread the items across',
                         default='ads1')
     parser.add_argument('-ah', dest='authHostname',
                         help='authorization server hostname',
@@ -188,6 +273,30 @@ def parse_args(args=None):
                         help='Output Received JSON Data messages to console',
                         default=False,
                         action='store_true')
+    parser.add_argument('-Xp', dest='prettyDump',
+                        help='As -X but pretty print the JSON rather than output the raw message',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-stdjson', dest='stdJson',
+                        help='Use the standard json module even if orjson is installed',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-oq', dest='outputQueue',
+                        help='Write -X/-sos/-sp/-ss output from a background thread with this size queue (0=write directly)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-op', dest='outputPolicy',
+                        help='When the output queue is full; block, drop or sample the lines',
+                        choices=output.POLICIES,
+                        default='block')
+    parser.add_argument('-osr', dest='outputSample',
+                        help='Sample policy keeps 1 in this many lines when the output queue is full',
+                        type=int,
+                        default=10)
+    parser.add_argument('-pl', dest='pipelineQueue',
+                        help='Parse + process the received frames on a worker thread, queueing up to this many frames (0=off)',
+                        type=int,
+                        default=0)
     parser.add_argument('-l', dest='logFilename',
                         help='Redirect console to filename',
                         default=None)
@@ -215,80 +324,216 @@ def parse_args(args=None):
                         help='Output received Status messages',
                         default=False,
                         action='store_true')
+    parser.add_argument('-bs', dest='batchSize',
+                        help='Max RICs per Batch request (0=all RICs in one Batch)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-mo', dest='maxOutstanding',
+                        help='Max items awaiting Refresh before sending next Batch (0=no limit)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-wb', dest='wireBytes',
+                        help='Count payload and wire bytes, frames and messages per frame in each direction and show with Statistics',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-lat', dest='latency',
+                        help='Record message processing + request to Refresh latencies and show with Statistics',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-prf', dest='profilePrefix',
+                        help='Filename prefix of the profiles written when profiling is toggled by SIGUSR1 or the control socket',
+                        default='profile')
+    parser.add_argument('-prm', dest='profileMode',
+                        help='Profile with cProfile or by sampling the message processing stack',
+                        choices=['cprofile', 'sample'],
+                        default='cprofile')
+    parser.add_argument('-prw', dest='profileWindowSecs',
+                        help='Stop profiling after this many seconds (0=until toggled again)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-prt', dest='profileMemory',
+                        help='Also write the tracemalloc allocation growth over the profiling window',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-rmp', dest='rampItems',
+                        help='Ramp load test - request this many more items at each step, until all the RICs are requested (0=off)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-rmi', dest='rampSecs',
+                        help='Seconds between ramp steps',
+                        type=int,
+                        default=10)
+    parser.add_argument('-rml', dest='rampMaxImageMs',
+                        help='Flag a ramp step when its p99 request to Refresh latency is above this many milliseconds (0=no threshold)',
+                        type=float,
+                        default=0)
+    parser.add_argument('-rmr', dest='rampMaxPingMs',
+                        help='Flag a ramp step when a Ping to Pong round trip is above this many milliseconds (0=no threshold)',
+                        type=float,
+                        default=0)
+    parser.add_argument('-rme', dest='rampMaxErrorPct',
+                        help='Flag a ramp step when above this percent of its responses are closed Status (0=no threshold)',
+                        type=float,
+                        default=0)
+    parser.add_argument('-rmx', dest='rampStop',
+                        help='Stop the ramp load test at the first step that crosses a threshold',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-tti', dest='imageTimeSlowest',
+                        help='Time each item from Batch request to complete image - distribution and this many slowest RICs reported at exit (0=off)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-tts', dest='imageTimeFile',
+                        help='Save the per item times to image to this CSV file at exit',
+                        default=None)
+    parser.add_argument('-ttc', dest='imageTimeCompare',
+                        help='Compare the times to image with those saved by a previous run e.g. cold vs warm cache',
+                        default=None)
+    parser.add_argument('-ic', dest='imageCache',
+                        help='Cache the item images - Refresh Fields with Updates merged in',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-icf', dest='imageFile',
+                        help='Dump the cached item images to this file on exit (enables -ic)',
+                        default=None)
+    parser.add_argument('-ici', dest='imageDumpSecs',
+                        help='Also dump the cached item images every interval in seconds (0=on exit only)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-xf', dest='exportFile',
+                        help='Export the Refresh Fields as columns to this CSV file on exit - or Parquet if it ends .parquet',
+                        default=None)
+    parser.add_argument('-ob', dest='orderBook',
+                        help='Build the MarketByOrder / MarketByPrice order books from the Map entries - depth, actions/sec and apply time shown with Statistics',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-cf', dest='conflateMs',
+                        help='Conflate the Updates for each item - emitted every interval in milliseconds (0=off)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-cfx', dest='conflateOutput',
+                        help='Output the conflated Updates as JSON - rather than just count them',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-top', dest='topItems',
+                        help='Show the N busiest and quietest items by Update rate with Statistics (0=off)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-rw', dest='rateWindowSecs',
+                        help='Moving average window in seconds for the message rates',
+                        type=int,
+                        default=60)
+    parser.add_argument('-sj', dest='jsonStatsFile',
+                        help='Append totals and rates to this JSON lines file every Statistics interval',
+                        default=None)
+    parser.add_argument('-mp', dest='metricsPort',
+                        help='Serve Prometheus metrics on http://localhost:port/metrics (0=off)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-cp', dest='controlPort',
+                        help='Accept add / remove / reissue RIC commands on localhost:port (0=off)',
+                        type=int,
+                        default=0)
+    parser.add_argument('-rec', dest='captureFile',
+                        help='Capture the received frames + timestamps to this file for later replay',
+                        default=None)
+    parser.add_argument('-rz', dest='captureCompress',
+                        help='Compress the capture file with gzip',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-replay', dest='replayFile',
+                        help='Replay a capture file through the message processing - no server connection made',
+                        default=None)
+    parser.add_argument('-rs', dest='replaySpeed',
+                        help='Replay speed; 1=original timing, N=N times faster, 0=as fast as possible',
+                        type=float,
+                        default=1.0)
+    parser.add_argument('-rc', dest='reconnect',
+                        help='Reconnect if the connection is lost - then Login and resubscribe the open items',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-rcd', dest='reconnectDelay',
+                        help='Initial reconnect backoff delay in seconds - doubles each failed attempt',
+                        type=float,
+                        default=1.0)
+    parser.add_argument('-rcm', dest='reconnectMaxDelay',
+                        help='Max reconnect backoff delay in seconds',
+                        type=float,
+                        default=60.0)
+    parser.add_argument('-np', dest='processes',
+                        help='Number of worker processes to split the RICs across - each with own connection',
+                        type=int,
+                        default=1)
+    parser.add_argument('-async', dest='asyncEngine',
+                        help='Use the asyncio engine - requires the websockets package',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-z', dest='compress',
+                        help='Negotiate permessage-deflate compression - asyncio engine only',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('-ns', dest='sessions',
+                        help='Number of connections per process driven by the asyncio engine',
+                        type=int,
+                        default=1)
     
     return (parser.parse_args(args))
 
-# Get auth tokens from auth server
-def get_sts_token(current_refresh_token):
-    """ 
-        Retrieves an authentication token. 
-        :param current_refresh_token: Refresh token retrieved from a previous authentication, used to retrieve a
-        subsequent access token. If not provided (i.e. on the initial authentication), the password is used.
-    """
-    
-    url = 'https://{}:{}/{}'.format(opts.authHostname, opts.authPort, auth_path)
-
-    if not current_refresh_token:  # First time through, send password
-        data = {'username': opts.user, 'password': opts.password, 'grant_type': 'password', 'takeExclusiveSignOnControl': True,
-                'scope': scope}
-        print("Sending authentication request with password to ", url, "...")
-    else:  # Use the given refresh token
-        data = {'username': opts.user, 'refresh_token': current_refresh_token, 'grant_type': 'refresh_token',
-                'takeExclusiveSignOnControl': True}
-        print("Sending authentication request with refresh token to ", url, "...")
-
-    try:
-        r = requests.post(url,
-                          headers={'Accept': 'application/json'},
-                          data=data,
-                          auth=(opts.clientid, client_secret),
-                          verify=True)
-
-    except requests.exceptions.RequestException as e:
-        print('RDP-GW authentication exception failure:', e)
-        return None, None, None
-
-    if r.status_code != 200:
-        print('RDP-GW authentication result failure:', r.status_code, r.reason)
-        print('Text:', r.text)
-        if r.status_code in [401,400] and current_refresh_token:
-            # Refresh token may have expired. Try again using machinedID + password.
-            return get_sts_token(None)
-        return None, None, None
-
-    auth_json = r.json()
-    print("RDP-GW Authentication succeeded. RECEIVED:")
-    print(json.dumps(auth_json, sort_keys=True, indent=2, separators=(',', ':')))
-
-    return auth_json['access_token'], auth_json['refresh_token'], auth_json['expires_in']
-
-
-if __name__ == '__main__':
-    opts = parse_args(sys.argv[1:])
-    # print("Invoked with:", opts)
-    if not validate_options():
-        print('Exit due to invalid arguments')
-        sys.exit(2)
-
-    #  Redirect console to file if logFilename specified
-    orig_stdout = sys.stdout
-    if (opts.logFilename!=None):
-        try:
-            print('Redirecting console to file "{}"'.format(opts.logFilename))
-            sys.stdout = open(opts.logFilename, "w")
-        except IOError:
-            print('Could not redirect console to file "{}"'.format(opts.logFilename))
-            sys.stdout = orig_stdout
-            sys.exit(2)
-
-    if rdp_mode:    # Are we going to connect to RDP
-        sts_token, refresh_token, expire_time = get_sts_token(None)
-        if not sts_token:
-            print("Could not get authorisaton token")
-            sys.exit(1)
+# Token source for the engine - reissued tokens from the parent process (shard workers)
+# or from the token manager thread
+def token_source(token_queue):
+    if token_queue is not None:
+        return token_queue
+    if token_manager.manager is not None:
+        return token_manager.manager.tokens
+    return None
+
+# Hand any reissued auth tokens to the connections - False if we could not get a token
+def reissue_tokens(tokens, sockets):
+    global sts_token
+    while (tokens is not None) and (not tokens.empty()):
+        token = tokens.get()
+        if token is None:
+            return False
+        sts_token = token
+        if market_data.logged_in:
+            for ws in sockets:
+                market_data.reissue_token(ws, sts_token)
+        else:   # Used when we next Login e.g. after reconnect
+            market_data.auth_token = sts_token
+    return True
 
-    original_expire_time = expire_time
-    
+# Ramp load test - steps and Pings run by the engine alongside the other periodic tasks
+def setup_ramp():
+    ramp.enabled = True
+    ramp.step_items = opts.rampItems
+    ramp.step_secs = opts.rampSecs
+    ramp.max_image_ms = opts.rampMaxImageMs
+    ramp.max_ping_ms = opts.rampMaxPingMs
+    ramp.max_error_pct = opts.rampMaxErrorPct
+    ramp.stop_on_breach = opts.rampStop
+    ramp.start(market_data.imgCnt, market_data.updCnt, market_data.closedCnt)
+    periodic_tasks.append((1, ramp_pings))
+    periodic_tasks.append((opts.rampSecs, ramp_step))
+
+# Ping the logged in connections - for the round trip time of each ramp step
+# Run by the threaded engine's main loop - so under the lock, as the Pongs are handled on the websocket thread
+def ramp_pings():
+    with market_data.lock:
+        ramp.send_pings([ws for ws, conn in market_data.connections.items() if conn.requested and not conn.relogin],
+                        market_data.send_text)
+
+# End of a ramp step - summarise it, then request the next step of items
+def ramp_step():
+    with market_data.lock:
+        more = market_data.request_more()
+        if not ramp.end_step(market_data.imgCnt, market_data.updCnt, market_data.closedCnt, more):
+            market_data.signal_shutdown()
+            return
+        market_data.request_more()
+
+# Pass the options and RICs to market_data ready for the Login and item requests
+def setup_market_data(source):
     # Set our RDP or ADS Login request credentials
     market_data.set_Login(opts.user,
                         opts.appID,
@@ -296,19 +541,54 @@ if __name__ == '__main__':
                         sts_token,
                         rdp_mode)
 
-    market_data.dumpRcvd = opts.dump
+    market_data.dumpRcvd = opts.dump or opts.prettyDump
+    market_data.dumpPretty = opts.prettyDump
+    if opts.stdJson:
+        codec.use_stdlib()
+    if opts.outputQueue>0:
+        output.start(opts.outputQueue, opts.outputPolicy, opts.outputSample)
+    if opts.pipelineQueue>0:
+        pipeline.start(opts.pipelineQueue, market_data.process_frame, market_data.on_error)
+    image_cache.enabled = opts.imageCache or bool(opts.imageFile)
+    item_stats.enabled = opts.topItems>0
+    column_export.enabled = bool(opts.exportFile)
+    order_book.enabled = opts.orderBook
+    wire.enabled = opts.wireBytes or opts.compress
+    wire.exact_wire = wire.enabled and opts.asyncEngine and (async_client.ClientConnection is not None)
+    async_client.compression = 'deflate' if opts.compress else None
+    image_times.enabled = opts.imageTimeSlowest>0
+    if opts.rampItems>0:
+        setup_ramp()
+    image_times.slowest_n = opts.imageTimeSlowest
+    if opts.conflateMs>0:
+        conflation.start(opts.conflateMs / 1000.0, opts.conflateOutput)
+        periodic_tasks.append((1, conflation.emit_if_due))
+    item_stats.top_n = opts.topItems
+    if opts.captureFile:
+        capture.start(opts.captureFile, opts.captureCompress)
+    if opts.imageFile and (opts.imageDumpSecs>0):
+        periodic_tasks.append((opts.imageDumpSecs, lambda: image_cache.dump(opts.imageFile)))
     market_data.dumpPP = opts.showPingPong
     market_data.dumpSent = opts.showSentMsgs
     market_data.dumpStatus = opts.showStatusMsgs
     market_data.autoExit = opts.autoExit
-
-    # User wants to exit once all item responsed from server 
-    # So switch to Snapshot mode.
-    if (opts.autoExit):
-        opts.snapshot=True
-        print("AutoExit selected so enabling Snapshot mode too")
-
-    market_data.set_Request_Attr(opts.service,simpleRics,opts.domain,opts.snapshot,extRics)
+    latency.enabled = opts.latency
+    reconnect.enabled = opts.reconnect
+    reconnect.base_delay = opts.reconnectDelay
+    reconnect.max_delay = opts.reconnectMaxDelay
+    market_data.trackItems = opts.reconnect or bool(opts.controlPort) or (len(endpoints.parse(opts.host, opts.port))>1)
+    if opts.controlPort:
+        control.start(opts.controlPort)
+        periodic_tasks.append((1, control.process_commands))
+    profiler.mode = opts.profileMode
+    profiler.prefix = opts.profilePrefix
+    profiler.window_secs = opts.profileWindowSecs
+    profiler.trace_memory = opts.profileMemory
+    profiler.install_signal()
+    periodic_tasks.append((1, profiler.check))
+
+    market_data.set_Request_Attr(opts.service,source,opts.domain,opts.snapshot)
+    market_data.set_Batch_Attr(opts.batchSize, opts.maxOutstanding)
 
     if (opts.viewNames!=None):
         vList = opts.viewNames.split(',')
@@ -317,10 +597,18 @@ if __name__ == '__main__':
         vList = list(map(int, opts.viewFIDs.split(',')))
         market_data.set_viewList(vList)
 
-    # Start websocket handshake
-    # Use 'wss' for rdp connection or 'ws' for ADS connection
-    protocol = "wss" if rdp_mode else "ws"
-    ws_address = protocol +"://{}:{}/WebSocket".format(opts.host, opts.port)
+# Publish our counters (and latency histograms) into the shared stats arrays of a shard worker
+def publish_stats(shard_stats):
+    if shard_stats is not None:
+        counts, latencies = shard_stats
+        counts[:] = [float(c) for c in market_data.get_counts()]
+        if latencies is not None:
+            latency.publish(latencies)
+
+# Start the websocket handshake - the WebSocketApp runs in its own thread
+# On a reconnect the new WebSocketApp takes over the connection state of old_ws_app
+# before its thread starts - so it is already in place when on_open fires
+def connect(ws_address, old_ws_app=None):
     print("Connecting to WebSocket " + ws_address + " ...")
     ws_app = websocket.WebSocketApp(ws_address, header=['User-Agent: Python'],
                                         on_message=market_data.on_message,
@@ -328,16 +616,33 @@ if __name__ == '__main__':
                                         on_close=market_data.on_close,
                                         subprotocols=['tr_json2'])
     ws_app.on_open = market_data.on_open
+    if old_ws_app is not None:
+        market_data.move_connection(old_ws_app, ws_app)
     # Event loop
     wst = threading.Thread(target=ws_app.run_forever, kwargs={'sslopt': {'check_hostname': False}})
     wst.start()
+    return ws_app
+
+# Connect to the server and loop until exit time, shutdown or CTRL+C
+# When running as a shard worker, stats are published to shard_stats and
+# reissued auth tokens are received from the parent via token_queue
+def run_session(shard_stats=None, token_queue=None):
+    global ws_app
+
+    # Start websocket handshake
+    # Use 'wss' for rdp connection or 'ws' for ADS connection
+    protocol = "wss" if rdp_mode else "ws"
+    ws_address = protocol +"://{}:{}/WebSocket".format(opts.host, opts.port)
+    ws_app = connect(ws_address)
 
     # Now lets run a loop to allow time to send and receive async responses from server
     try:
         # Determine how often to output basic stats
         stat_time = time.time() + opts.statsTimeSecs
-        # When do we next need to reissue the auth token
-        reissue_token_time = time.time() + (int(expire_time) - 30)
+        # Reissued auth tokens - refreshed in the background
+        tokens = token_source(token_queue)
+        # When are the periodic tasks next due
+        task_times = [time.time() + interval for interval, task in periodic_tasks]
         
         # When should we stop looping and exit
         end_time = None
@@ -353,38 +658,355 @@ if __name__ == '__main__':
             
             time.sleep(1)
 
-            # If we are connected to RDP, check if its time to re-authorise
-            if ((rdp_mode) and time.time()>=reissue_token_time):
-                sts_token, refresh_token, expire_time = get_sts_token(refresh_token)
-                if not sts_token:
-                    print("Could not get authorisaton token")
-                    break
-                if int(expire_time) != int(original_expire_time):
-                    print('expire time changed from ' + str(original_expire_time) + 's to ' + str(expire_time) + 's; retry with password')
-                    sts_token, refresh_token, expire_time = get_sts_token(None)
-                    if not sts_token:
-                        print("Could not get Refresh token")
-                        break
-                    original_expire_time = expire_time
-                if market_data.logged_in:
-                    market_data.reissue_token(ws_app,sts_token)
-                # Reset the token reissue time
-                reissue_token_time = time.time() + (int(expire_time) - 30)
-
-            # Is is time to print some basic stats?
-            if (time.time() >= stat_time):
+            if not reissue_tokens(tokens, [ws_app]):
+                break
+
+            publish_stats(shard_stats)
+
+            for i, (interval, task) in enumerate(periodic_tasks):
+                if time.time() >= task_times[i]:
+                    task()
+                    task_times[i] = time.time() + interval
+
+            # Is is time to print some basic stats? Parent process prints stats for shards
+            if (shard_stats is None) and (time.time() >= stat_time):
                 market_data.print_stats()
                 stat_time = time.time() + opts.statsTimeSecs
             
             # Check to see if we have not received a PING from server in a while
             if market_data.ping_timedout():
-                break   # Exit loop and app
+                if not reconnect.enabled:
+                    break   # Exit loop and app
+                ws_app.close()      # on_close schedules the reconnect
+
+            # Connection lost and reconnect attempt due - new WebSocketApp takes over the connection state
+            conn = market_data.connections.get(ws_app)
+            if conn is not None and conn.reconnect_time and time.time() >= conn.reconnect_time:
+                ws_app = connect(ws_address, ws_app)
 
     except KeyboardInterrupt:
         pass
     finally:
+        market_data.signal_shutdown()   # So closing is not taken as a lost connection
         ws_app.close()
+        pipeline.stop()     # Process the frames already received before the final stats
+        output.stop()
+        publish_stats(shard_stats)
+        if shard_stats is None:
+            market_data.print_stats()
+
+# asyncio engine - one event loop drives all the sessions (-ns) without a thread per connection
+# Stats, token reissue and exit timers are scheduled on the loop rather than polled
+async def run_async_sessions(shard_stats=None, token_queue=None):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    market_data.shutdown_callback = lambda: loop.call_soon_threadsafe(stop.set)
+
+    protocol = "wss" if rdp_mode else "ws"
+    ws_address = protocol +"://{}:{}/WebSocket".format(opts.host, opts.port)
+    sslctx = async_client.make_ssl_context() if rdp_mode else None
+    names = endpoints.parse(opts.host, opts.port)
+    if len(names)>1:    # A session per host - each requesting the RICs hashed to it
+        sessions = [async_client.AsyncSession(protocol + "://{}/WebSocket".format(name),
+                                              market_data.ricSource.select(endpoints.owns(name)), sslctx)
+                        for name in names]
+        endpoints.setup(names, sessions)
+    else:
+        sessions = [async_client.AsyncSession(ws_address, source, sslctx)
+                        for source in split_rics(market_data.ricSource, opts.sessions)]
+
+    # Shard workers publish stats - reissued tokens come from the parent process or the token manager
+    tokens = token_source(token_queue)
+    def tick():
+        publish_stats(shard_stats)
+        if not reissue_tokens(tokens, sessions):
+            stop.set()
+
+    tasks = [asyncio.ensure_future(session.run()) for session in sessions]
+    tasks.append(asyncio.ensure_future(async_client.every(1, tick)))
+    if shard_stats is None:
+        tasks.append(asyncio.ensure_future(async_client.every(opts.statsTimeSecs, market_data.print_stats)))
+    for interval, task in periodic_tasks:
+        tasks.append(asyncio.ensure_future(async_client.every(interval, task)))
+
+    if (opts.exitTimeMins>0):
+        loop.call_later(60*opts.exitTimeMins, stop.set)
+        print("Run for", opts.exitTimeMins, "minute(s)")
+    else:
+        print("Run indefinitely - CTRL+C to break")
+
+    # Run until shutdown signalled, exit time reached or all the sessions have closed
+    sessions_done = asyncio.gather(*tasks[:len(sessions)], return_exceptions=True)
+    try:
+        await asyncio.wait([sessions_done, asyncio.ensure_future(stop.wait())],
+                           return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        market_data.signal_shutdown()   # So closing is not taken as a lost connection
+        for session in sessions:
+            await session.close()
+        for task in tasks:
+            task.cancel()
+        output.stop()
+        publish_stats(shard_stats)
+        if shard_stats is None:
+            market_data.print_stats()
+
+# Run the selected engine until exit
+def run_engine(shard_stats=None, token_queue=None):
+    if opts.asyncEngine:
+        try:
+            asyncio.run(run_async_sessions(shard_stats, token_queue))
+        except KeyboardInterrupt:
+            pass
+    else:
+        run_session(shard_stats, token_queue)
+
+    capture.stop()
+    profiler.stop()     # Write the profile if still profiling
+
+    # Dump the final item images
+    if opts.imageFile:
+        image_cache.dump(opts.imageFile)
+        print('Item images written to "{}"'.format(opts.imageFile))
+    if opts.exportFile:
+        column_export.write(opts.exportFile)
+    if ramp.enabled:
+        ramp.print_table()
+    if image_times.enabled:
+        image_times.print_report(opts.imageTimeCompare)
+        if opts.imageTimeFile:
+            image_times.save(opts.imageTimeFile)
+
+# Shard workers exit as if CTRL+C pressed when the parent terminates them
+def shard_stop_handler(signum, frame):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+# Entry point of a shard worker process - with its own connection and login
+def run_shard(shard, shard_opts, token, source, shard_stats, token_queue):
+    global opts, sts_token, rdp_mode
+    token_manager.manager = None    # Parent refreshes the tokens for us
+    # CTRL+C is handled by the parent, which then terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, shard_stop_handler)
+    opts = shard_opts
+    if opts.imageFile:  # Each shard dumps its own images
+        opts.imageFile = '{}.{}'.format(opts.imageFile, shard)
+    if opts.captureFile:    # and captures to its own file
+        opts.captureFile = '{}.{}'.format(opts.captureFile, shard)
+    if opts.exportFile:     # and exports to its own file - keeping the extension
+        name, ext = os.path.splitext(opts.exportFile)
+        opts.exportFile = '{}.{}{}'.format(name, shard, ext)
+    opts.profilePrefix = '{}.{}'.format(opts.profilePrefix, shard)    # and profiles
+    for name in ('imageTimeFile', 'imageTimeCompare'):     # and times to image
+        if getattr(opts, name):
+            filename, ext = os.path.splitext(getattr(opts, name))
+            setattr(opts, name, '{}.{}{}'.format(filename, shard, ext))
+    sts_token = token
+    rdp_mode = bool(opts.password)
+    setup_market_data(source)
+    # Parent only has the merged counters - so each shard reports its own busiest / quietest items
+    if item_stats.enabled:
+        periodic_tasks.append((opts.statsTimeSecs,
+                               lambda: item_stats.print_stats("Shard {} ".format(shard))))
+    run_engine(shard_stats, token_queue)
+
+# Feed a capture file back through market_data.on_message - no server required
+def run_replay():
+    stat_time = [time.time() + opts.statsTimeSecs]
+    task_times = [time.time() + interval for interval, task in periodic_tasks]
+
+    # Called between frames - output stats and run the periodic tasks when due
+    def tick():
+        now = time.time()
+        for i, (interval, task) in enumerate(periodic_tasks):
+            if now >= task_times[i]:
+                task()
+                task_times[i] = now + interval
+        if now >= stat_time[0]:
+            market_data.print_stats()
+            stat_time[0] = now + opts.statsTimeSecs
+
+    print('Replaying "{}" at {}'.format(opts.replayFile,
+          '{}x speed'.format(opts.replaySpeed) if opts.replaySpeed>0 else 'max speed'))
+    try:
+        frames, elapsed, sent = capture.replay(opts.replayFile, market_data.on_message,
+                                               opts.replaySpeed, tick)
+        print("Replayed {} frames in {:.2f}secs - {:.1f} frames/sec, {} messages not sent"
+            .format(frames, elapsed, frames / elapsed if elapsed else 0, sent))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        output.stop()
+        profiler.stop()
         market_data.print_stats()
+        if opts.exportFile:
+            column_export.write(opts.exportFile)
+
+# Split the RICs across the shards - round robin so each shard gets a similar mix of domains
+# Shards that would get no RICs are left out e.g. more shards than RICs
+def split_rics(source, shards):
+    if source is None:
+        return [None]
+    return [part for part in source.split(shards) if part.has_rics()]
+
+# Print the merged stats of all the shard worker processes, followed by a per shard breakdown
+def print_shard_stats(shard_stats):
+    counts = [dict(zip(market_data.STAT_FIELDS, stats[0][:])) for stats in shard_stats]
+    started = [c['start_time'] for c in counts if c['start_time']]
+    print(market_data.format_stats(sum(int(c['imgCnt']) for c in counts),
+                                   sum(int(c['updCnt']) for c in counts),
+                                   sum(int(c['statusCnt']) for c in counts),
+                                   sum(int(c['pingCnt']) for c in counts),
+                                   min(started) if started else 0))
+    for i, c in enumerate(counts):
+        print(market_data.format_stats(int(c['imgCnt']), int(c['updCnt']),
+                                       int(c['statusCnt']), int(c['pingCnt']),
+                                       c['start_time'], "  Shard {}".format(i)))
+    metrics.print_rates()
+    if opts.latency:
+        latency.print_latency(latency.merge_shared([stats[1] for stats in shard_stats]))
+    token_manager.print_stats()
+
+# Counters of all the shard workers added together
+def sum_shard_counts(shard_stats):
+    totals = dict.fromkeys(market_data.STAT_FIELDS, 0)
+    for stats in shard_stats:
+        for name, value in zip(market_data.STAT_FIELDS, stats[0][:]):
+            totals[name] += value
+    return totals
+
+# Windowed rates sampled every second - optionally exported as JSON lines and to Prometheus
+def setup_metrics(get_counts):
+    metrics.window_secs = opts.rateWindowSecs
+    periodic_tasks.append((1, lambda: metrics.sample(get_counts())))
+    if opts.jsonStatsFile:
+        periodic_tasks.append((opts.statsTimeSecs, lambda: metrics.write_json_line(opts.jsonStatsFile)))
+    if opts.metricsPort:
+        metrics.start_http_server(opts.metricsPort)
+
+# Pass any reissued auth tokens on to the shard workers - False if we could not get a token
+def forward_tokens(tokens, token_queues):
+    while (tokens is not None) and (not tokens.empty()):
+        token = tokens.get()
+        if token is None:
+            return False
+        for q in token_queues:
+            q.put(token)
+    return True
+
+# Split the RICs across several worker processes, each with its own connection and login
+# The parent process aggregates the worker stats and reissues the RDP auth tokens
+def run_shards():
+    shards = opts.processes
+    shard_stats = []
+    token_queues = []
+    workers = []
+    for i, part in enumerate(split_rics(ricSource, shards)):
+        shard_stats.append((multiprocessing.Array('d', len(market_data.STAT_FIELDS)),
+                            multiprocessing.Array('q', latency.SHARED_SIZE) if opts.latency else None))
+        token_queues.append(multiprocessing.Queue())
+        worker = multiprocessing.Process(target=run_shard,
+                                         args=(i, opts, sts_token, part,
+                                               shard_stats[-1], token_queues[-1]))
+        worker.start()
+        workers.append(worker)
+    print("Started {} shard worker processes".format(len(workers)))
+    # Profiling toggled in all the workers - each writes its own profile
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: [os.kill(w.pid, signal.SIGUSR1) for w in workers
+                                                             if w.is_alive()])
+    if token_manager.manager is not None:
+        token_manager.manager.start()
+    setup_metrics(lambda: sum_shard_counts(shard_stats))
+    task_times = [time.time() + interval for interval, task in periodic_tasks]
+
+    try:
+        stat_time = time.time() + opts.statsTimeSecs
+        tokens = token_source(None)
+        end_time = None
+        if (opts.exitTimeMins>0):
+            end_time = time.time() + 60*opts.exitTimeMins
+
+        # Loop until all the workers have exited or the specified end time
+        while (any(w.is_alive() for w in workers) and
+                    ((opts.exitTimeMins==0) or (time.time() < end_time))):
+            time.sleep(1)
+
+            # Auth token is reissued once and handed to each of the workers
+            if not forward_tokens(tokens, token_queues):
+                break
+
+            for i, (interval, task) in enumerate(periodic_tasks):
+                if time.time() >= task_times[i]:
+                    task()
+                    task_times[i] = time.time() + interval
+
+            if (time.time() >= stat_time):
+                print_shard_stats(shard_stats)
+                stat_time = time.time() + opts.statsTimeSecs
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Ask the workers to exit, so they can finish cleanly
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+        for w in workers:
+            w.join(15)
+            if w.is_alive():
+                w.kill()
+                w.join()
+        print_shard_stats(shard_stats)
+
+
+if __name__ == '__main__':
+    opts = parse_args(sys.argv[1:])
+    # print("Invoked with:", opts)
+    if not validate_options():
+        print('Exit due to invalid arguments')
+        sys.exit(2)
+
+    #  Redirect console to file if logFilename specified
+    orig_stdout = sys.stdout
+    if (opts.logFilename!=None):
+        try:
+            print('Redirecting console to file "{}"'.format(opts.logFilename))
+            sys.stdout = open(opts.logFilename, "w")
+        except IOError:
+            print('Could not redirect console to file "{}"'.format(opts.logFilename))
+            sys.stdout = orig_stdout
+            sys.exit(2)
+
+    if rdp_mode and not opts.replayFile:    # Are we going to connect to RDP
+        token_manager.manager = token_manager.TokenManager(
+            'https://{}:{}/{}'.format(opts.authHostname, opts.authPort, auth_path),
+            opts.user, opts.password, opts.clientid, client_secret, scope)
+        if not token_manager.manager.login():
+            print("Could not get authorisaton token")
+            sys.exit(1)
+        sts_token = token_manager.manager.access_token
+
+    # User wants to exit once all item responsed from server 
+    # So switch to Snapshot mode.
+    if (opts.autoExit):
+        opts.snapshot=True
+        print("AutoExit selected so enabling Snapshot mode too")
+
+    if (opts.processes>1):
+        run_shards()
+    else:
+        setup_market_data(ricSource)
+        setup_metrics(lambda: dict(zip(market_data.STAT_FIELDS, market_data.get_counts())))
+        if opts.replayFile:
+            run_replay()
+        else:
+            if token_manager.manager is not None:
+                token_manager.manager.start()
+            run_engine()
+
+    if token_manager.manager is not None:
+        token_manager.manager.stop()
 
     sys.stdout = orig_stdout
 #
@@ -0,0 +1,133 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Ramp load test - items added a step at a time, each step measured against latency and error thresholds """
+
+import time
+from latency import Histogram
+
+enabled = False         # Ramp the item requests - set by -rmp
+step_items = 500        # Items added at each step
+step_secs = 10          # Seconds between steps
+max_image_ms = 0        # Thresholds - flagged when the step p99 / max / rate is above them (0=no threshold)
+max_ping_ms = 0
+max_error_pct = 0
+stop_on_breach = False  # Stop the test at the first breach - rather than flag it and carry on
+
+PING_MESSAGE = '{"Type":"Ping"}'
+
+limit = 0               # Items that may be requested so far
+requested = 0           # Items requested - not including resubscribes after a reconnect
+complete = False        # All the items have been requested
+breached = False
+
+image_hist = Histogram()    # Request to Refresh of the items responding in this step
+ping_hist = Histogram()     # Client Ping to Pong round trip in this step
+ping_secs = 0.0             # Total of the round trips in this step - for the average
+pings = {}              # websocket -> time our Ping was sent, until the Pong arrives
+step_start = 0.0
+step_updates = 0        # Counters at the start of the step
+step_refreshes = 0
+step_closed = 0
+steps = []              # Summary row of each step
+
+HEADER = ("{:>4} {:>8} {:>10} {:>8} {:>10} {:>10} {:>10} {:>10} {:>7}  {}"
+          .format('Step', 'Items', 'Upd/s', 'Images', 'Image p50', 'Image p99', 'Ping avg', 'Ping max', 'Errors', 'Status'))
+ROW = "{:>4} {:>8} {:>10.1f} {:>8} {:>8.1f}ms {:>8.1f}ms {:>8.1f}ms {:>8.1f}ms {:>6.2f}%  {}"
+
+def start(refreshes, updates, closed):
+    global limit, step_start, step_updates, step_refreshes, step_closed
+    limit = step_items
+    step_start = time.time()
+    step_updates, step_refreshes, step_closed = updates, refreshes, closed
+    print("Ramp; {} items every {}secs".format(step_items, step_secs))
+
+# Room in this step to request a Batch of count items - counted as requested if so
+def allow(count):
+    global requested
+    if requested + count > limit:
+        return False
+    requested += count
+    return True
+
+def image_latency(secs):
+    image_hist.record(secs)
+
+# Ping each connection with send(ws, text) - unless still waiting for the Pong to the last one
+def send_pings(sockets, send):
+    now = time.perf_counter()
+    for ws in sockets:
+        sent = pings.get(ws)
+        if (sent is None) or (now - sent > step_secs):     # Pong lost e.g. connection dropped
+            pings[ws] = now
+            send(ws, PING_MESSAGE)
+
+def pong(ws):
+    global ping_secs
+    sent = pings.pop(ws, None)
+    if sent is not None:
+        secs = time.perf_counter() - sent
+        ping_hist.record(secs)
+        ping_secs += secs
+
+# Thresholds crossed by a step - as Status text
+def check_thresholds(image_p99, ping_max, error_pct):
+    breaches = []
+    if max_image_ms and (image_p99 > max_image_ms):
+        breaches.append('image latency')
+    if max_ping_ms and (ping_max > max_ping_ms):
+        breaches.append('ping')
+    if max_error_pct and (error_pct > max_error_pct):
+        breaches.append('errors')
+    return breaches
+
+# Summarise the step just finished and start the next - returns False to stop the test
+# more is True while there are items left to request
+def end_step(refreshes, updates, closed, more):
+    global image_hist, ping_hist, ping_secs, step_start, step_updates, step_refreshes, step_closed
+    global limit, complete, breached
+    now = time.time()
+    elapsed = max(now - step_start, 0.001)
+    images = refreshes - step_refreshes
+    errors = closed - step_closed
+    error_pct = errors * 100.0 / (images + errors) if (images + errors) else 0.0
+    image_p99 = image_hist.percentile(99) / 1000.0
+    ping_max = ping_hist.max_value / 1000.0
+    breaches = check_thresholds(image_p99, ping_max, error_pct)
+    status = 'BREACH ' + ', '.join(breaches) if breaches else 'OK'
+    row = ROW.format(len(steps) + 1, requested, (updates - step_updates) / elapsed, images,
+                     image_hist.percentile(50) / 1000.0, image_p99,
+                     ping_secs * 1000.0 / ping_hist.total() if ping_hist.total() else 0.0, ping_max,
+                     error_pct, status)
+    steps.append(row)
+    print("Ramp; " + HEADER)
+    print("Ramp; " + row)
+
+    image_hist = Histogram()
+    ping_hist = Histogram()
+    ping_secs = 0.0
+    step_start = now
+    step_updates, step_refreshes, step_closed = updates, refreshes, closed
+    if breaches:
+        breached = True
+        if stop_on_breach:
+            print("Ramp; Stopping at step {} - {}".format(len(steps), status))
+            return False
+    if more:
+        limit += step_items
+    elif not complete:
+        complete = True
+        print("Ramp; All {} items requested".format(requested))
+    return True
+
+def print_table():
+    print("Ramp; Summary of {} steps of {} items every {}secs{}".format(
+        len(steps), step_items, step_secs, " - thresholds breached" if breached else ""))
+    print(HEADER)
+    for row in steps:
+        print(row)
@@ -0,0 +1,41 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Reconnect backoff timing and outage / recovery stats """
+
+import random
+
+enabled = False     # Reconnect when the connection is lost - set by -rc
+base_delay = 1.0    # Delay before the first reconnect attempt in seconds
+max_delay = 60.0    # Cap on the delay between attempts
+
+count = 0           # Successful reconnects i.e. logged in again
+outages = []        # Seconds from connection lost to logged in again - per reconnect
+recoveries = []     # Seconds from connection lost to all resubscribed items responded
+
+# Exponential backoff with full jitter - so many clients do not all retry at the same time
+def backoff(attempt):
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def record_outage(secs):
+    global count
+    count += 1
+    outages.append(secs)
+    print("Reconnected and logged in after {:.2f}secs outage".format(secs))
+
+def record_recovery(secs, items):
+    recoveries.append(secs)
+    print("Recovered; {} items resubscribed in {:.2f}secs from connection lost".format(items, secs))
+
+def print_stats():
+    if not count:
+        return
+    print("Reconnects: {} \tOutage last: {:.2f}secs max: {:.2f}secs \tRecovery last: {} max: {}".format(
+        count, outages[-1], max(outages),
+        '{:.2f}secs'.format(recoveries[-1]) if recoveries else '-',
+        '{:.2f}secs'.format(max(recoveries)) if recoveries else '-'))
@@ -0,0 +1,101 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Source of the RICs to request - a list, or a file read lazily into Batches as they are needed """
+
+from collections import defaultdict
+
+# Yield (Domain, [RICs]) Batches of up to size RICs (0=no limit) from (Domain, RIC) entries - a Batch per Domain
+def group_batches(entries, size):
+    grouped = defaultdict(list)
+    for domain, ric in entries:
+        batch = grouped[domain]
+        batch.append(ric)
+        if size and len(batch) >= size:
+            yield domain, batch
+            grouped[domain] = []
+    for domain, batch in grouped.items():
+        if batch:
+            yield domain, batch
+
+# RICs from the command line (-items) or a file (-f / -ef), optionally one part of a split
+# Files are read a line at a time as Batches are requested, so the whole universe is never
+# held in memory - multi domain RICs are grouped by Domain as they are read
+class RicSource:
+
+    def __init__(self, rics=None, filename=None, multi_domain=False, parts=(), keep=None):
+        self.rics = rics                # List of RICs, or (Domain, RIC) tuples if multi_domain
+        self.filename = filename        # File of RICs - one per line, or Domain|RIC if multi_domain
+        self.multi_domain = multi_domain
+        self.parts = parts              # ((index, count), ...) - this source is part index of count
+        self.keep = keep                # keep((Domain, RIC)) is True for the entries wanted - None for all
+
+    # Split into count sources - round robin so each part gets a similar mix of Domains
+    def split(self, count):
+        return [RicSource(self.rics, self.filename, self.multi_domain, self.parts + ((i, count),), self.keep)
+                for i in range(count)]
+
+    # Only the entries of this source selected by keep - e.g. those hashed to one endpoint
+    def select(self, keep):
+        return RicSource(self.rics, self.filename, self.multi_domain, self.parts, keep)
+
+    def _read_file(self):
+        with open(self.filename, 'r') as f:
+            for line in f:
+                if self.multi_domain:
+                    tmp = line.split("|")
+                    try:                    # Add entry as Domain number, RIC
+                        yield (int(tmp[0]), str(tmp[1]).strip(' \t\n\r'))  # strip any whitespaces
+                    except (ValueError, IndexError):
+                        pass
+                else:
+                    yield line.strip(' \t\n\r')
+
+    # (Domain, RIC) entries in this part - Domain is None unless multi_domain
+    # Duplicates are dropped from a list of RICs, but a file is requested as it is - remembering
+    # each RIC read to spot duplicates would hold the whole universe in memory
+    def items(self):
+        entries = self._read_file() if self.filename else iter(self.rics)
+        seen = None if self.filename else set()
+        positions = [0] * len(self.parts)
+        for entry in entries:
+            if not entry:
+                continue
+            if seen is not None:
+                if entry in seen:
+                    continue
+                seen.add(entry)
+            # Keep the entry if it falls in our part at each level of splitting
+            wanted = True
+            for level, (index, count) in enumerate(self.parts):
+                position = positions[level]
+                positions[level] += 1
+                if position % count != index:
+                    wanted = False
+                    break
+            if not wanted:
+                continue
+            if self.multi_domain:
+                if not entry[1]:
+                    continue
+            else:
+                entry = (None, entry)
+            if (self.keep is None) or self.keep(entry):
+                yield entry
+
+    def has_rics(self):
+        return next(self.items(), None) is not None
+
+    # Batches of up to size RICs read as they are needed
+    def batches(self, size):
+        return group_batches(self.items(), size)
+
+    def describe(self):
+        if self.filename:
+            return 'file "{}"'.format(self.filename)
+        return '{} RICs'.format(len(self.rics))
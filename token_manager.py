@@ -0,0 +1,133 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" RDP auth tokens - refreshed ahead of expiry by a background thread over a keep-alive HTTPS session """
+
+import json
+import time
+import queue
+import threading
+import requests
+
+manager = None      # Active TokenManager - when connecting to RDP
+
+RETRY_SECS = 10     # Delay between attempts when a refresh fails
+
+class TokenManager(threading.Thread):
+
+    def __init__(self, url, username, password, client_id, client_secret='', scope='trapi', margin=30):
+        threading.Thread.__init__(self, name='TokenManager', daemon=True)
+        self.url = url
+        self.username = username
+        self.password = password
+        self.scope = scope
+        self.margin = margin    # Refresh this many seconds before the token expires
+        # One session so the TLS connection to the auth server is reused
+        self.session = requests.Session()
+        self.session.headers['Accept'] = 'application/json'
+        self.session.auth = (client_id, client_secret)
+        self.tokens = queue.Queue()     # New access tokens for the engine - None if we could not get one
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_in = 0
+        self.original_expires_in = 0
+        self.expiry_time = 0
+        self.stop_event = threading.Event()
+        self.refreshes = 0          # Successful token refreshes - not including the initial login
+        self.failures = 0
+        self.last_latency = 0.0     # Seconds taken by the last successful refresh
+        self.max_latency = 0.0
+
+    # Single auth request - with the password if no refresh token
+    # Returns the auth response JSON or None
+    def _request(self, refresh_token=None):
+        if not refresh_token:  # First time through, send password
+            data = {'username': self.username, 'password': self.password, 'grant_type': 'password',
+                    'takeExclusiveSignOnControl': True, 'scope': self.scope}
+            print("Sending authentication request with password to ", self.url, "...")
+        else:  # Use the given refresh token
+            data = {'username': self.username, 'refresh_token': refresh_token, 'grant_type': 'refresh_token',
+                    'takeExclusiveSignOnControl': True}
+            print("Sending authentication request with refresh token to ", self.url, "...")
+
+        try:
+            r = self.session.post(self.url, data=data, verify=True, timeout=30)
+        except requests.exceptions.RequestException as e:
+            print('RDP-GW authentication exception failure:', e)
+            return None
+
+        if r.status_code != 200:
+            print('RDP-GW authentication result failure:', r.status_code, r.reason)
+            print('Text:', r.text)
+            return None
+
+        auth_json = r.json()
+        print("RDP-GW Authentication succeeded. RECEIVED:")
+        print(json.dumps(auth_json, sort_keys=True, indent=2, separators=(',', ':')))
+        return auth_json
+
+    # Get a token using the refresh token - falling back to the password if the refresh token
+    # is rejected, e.g. has expired, or the expiry time has changed
+    def get_token(self):
+        auth_json = None
+        if self.refresh_token:
+            auth_json = self._request(self.refresh_token)
+            if (auth_json is not None) and (int(auth_json['expires_in']) != int(self.original_expires_in)):
+                print('expire time changed from ' + str(self.original_expires_in) + 's to ' +
+                      str(auth_json['expires_in']) + 's; retry with password')
+                auth_json = None
+        if auth_json is None:
+            auth_json = self._request(None)
+            if auth_json is None:
+                return False
+            self.original_expires_in = auth_json['expires_in']
+        self.access_token = auth_json['access_token']
+        self.refresh_token = auth_json['refresh_token']
+        self.expires_in = int(auth_json['expires_in'])
+        self.expiry_time = time.time() + self.expires_in
+        return True
+
+    # Initial token - before connecting
+    def login(self):
+        return self.get_token()
+
+    def _refresh_delay(self):
+        return max(1, self.expiry_time - self.margin - time.time())
+
+    # Refresh ahead of expiry and queue the new token for the engine
+    def run(self):
+        delay = self._refresh_delay()
+        while not self.stop_event.wait(delay):
+            started = time.perf_counter()
+            if self.get_token():
+                self.last_latency = time.perf_counter() - started
+                self.max_latency = max(self.max_latency, self.last_latency)
+                self.refreshes += 1
+                self.tokens.put(self.access_token)
+                delay = self._refresh_delay()
+            else:
+                self.failures += 1
+                if time.time() + RETRY_SECS >= self.expiry_time:
+                    print("Could not get authorisaton token")
+                    self.tokens.put(None)
+                    return
+                delay = RETRY_SECS
+
+    # Stop refreshing - waiting a while for any refresh in progress - and close the keep-alive session
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join(5)
+        self.session.close()
+
+def print_stats():
+    if manager is None:
+        return
+    print("Auth; Token refreshes: {} \tFailures: {} \tLast refresh: {:.3f}secs \tMax: {:.3f}secs \tExpires in: {:.0f}secs"
+          .format(manager.refreshes, manager.failures, manager.last_latency, manager.max_latency,
+                  max(0, manager.expiry_time - time.time())))
@@ -0,0 +1,66 @@
+#|-----------------------------------------------------------------------------
+#|            This source code is provided under the Apache 2.0 license      --
+#|  and is provided AS IS with no warranty or guarantee of fit for purpose.  --
+#|                See the project's LICENSE.md for details.                  --
+#|           Copyright Refinitiv 2019. All rights reserved.                  --
+#|-----------------------------------------------------------------------------
+
+#!/usr/bin/env python
+""" Byte accounting per direction - JSON payload and WebSocket wire bytes, frames and messages per frame """
+
+enabled = False     # Count the bytes - set by -wb
+compression = None  # Extension negotiated e.g. 'permessage-deflate' - None if not compressed
+
+# When the engine cannot see the bytes on the wire they are worked out from the payload
+# plus the WebSocket frame header - frames sent by the client are also masked
+exact_wire = False  # Set by the engine when it counts the actual wire bytes
+
+recv_frames = 0
+recv_payload = 0    # Bytes of JSON received - UTF-8 encoded, as framed
+recv_wire = 0       # WebSocket bytes received - compressed if compression negotiated
+recv_messages = 0   # Messages in the JSON arrays received
+
+sent_frames = 0
+sent_payload = 0
+sent_wire = 0
+
+# RFC 6455 frame header size for a payload of length bytes
+def frame_overhead(length, masked):
+    size = 2 if length < 126 else 4 if length < 65536 else 10
+    return size + 4 if masked else size
+
+def received(length):
+    global recv_frames, recv_payload, recv_wire
+    recv_frames += 1
+    recv_payload += length
+    if not exact_wire:
+        recv_wire += length + frame_overhead(length, False)
+
+def sent(length):
+    global sent_frames, sent_payload, sent_wire
+    sent_frames += 1
+    sent_payload += length
+    if not exact_wire:
+        sent_wire += length + frame_overhead(length, True)
+
+# Called by the engine with the actual bytes read from / written to the connection
+def wire_received(length):
+    global recv_wire
+    recv_wire += length
+
+def wire_sent(length):
+    global sent_wire
+    sent_wire += length
+
+# Wire bytes as a percentage of the payload - how much compression saves
+def ratio(wire_bytes, payload):
+    return wire_bytes * 100.0 / payload if payload else 0.0
+
+def print_stats():
+    print("Bytes; Received: {} payload \t{} wire ({:.1f}%) \tFrames: {} \tAvg frame: {:.0f} bytes \tMsgs per frame: {:.2f}"
+          .format(recv_payload, recv_wire, ratio(recv_wire, recv_payload), recv_frames,
+                  recv_wire / recv_frames if recv_frames else 0, recv_messages / recv_frames if recv_frames else 0))
+    print("Bytes; Sent: {} payload \t{} wire ({:.1f}%) \tFrames: {} \tAvg frame: {:.0f} bytes \tCompression: {}{}"
+          .format(sent_payload, sent_wire, ratio(sent_wire, sent_payload), sent_frames,
+                  sent_wire / sent_frames if sent_frames else 0, compression or 'none',
+                  '' if exact_wire else ' \t(wire bytes worked out from the frame sizes)'))